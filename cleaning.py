@@ -0,0 +1,21 @@
+"""Rules shared by vis.py and vis-rewrite.py, kept in one place so both tools agree: which readings are outliers
+(vis.py's HampelFilter, vis-rewrite.py's --scan) and which gaps energy is integrated across (--energy, --rank energy).
+"""
+import numpy as np
+
+CLEAN_WINDOW = 11 # samples in the rolling window used to flag outliers, about an hour of HPC polling
+CLEAN_SIGMAS = 3.0 # how many scaled MADs a sample may sit from the rolling median before it is replaced
+MAD_SCALE = 1.4826 # scales the MAD so it estimates the standard deviation of normally distributed data
+CLEAN_MIN_SCALE = 0.05 # kW, floor on the scaled MAD: readings come in 1 W steps and often sit flat, where a MAD of 0
+                       # would flag any change at all, so a sample must be more than CLEAN_SIGMAS * 50 W off to count
+ENERGY_GAP = 900 # seconds; samples further apart than this are not integrated across, the time between them is uncovered
+
+def hampel_rule(windows, center, sigmas=CLEAN_SIGMAS):
+    """Median of each window (last axis) and whether the sample at its center is an outlier: more than
+    `sigmas` scaled MADs, but never less than `sigmas` * CLEAN_MIN_SCALE, from that median. A window holding a NaN
+    flags nothing.
+    """
+    median = np.median(windows, axis=-1)
+    scale = np.maximum(MAD_SCALE * np.median(np.abs(windows - median[..., None]), axis=-1), CLEAN_MIN_SCALE)
+    with np.errstate(invalid='ignore'):
+        return median, np.abs(center - median) > sigmas * scale
@@ -2,15 +2,50 @@ import argparse
 import csv
 import datetime as dt
 import locale
+import numpy as np
 import pandas as pd
 import pathlib
 import re
 import subprocess
-# "glob" and "os" are for combining the csvs into one dataframe - Ben 5/28/25
-import glob
-import os
+import time
+import warnings
 
-from typing import Any
+from dateutil import tz
+from typing import Any, Optional
+
+from cleaning import CLEAN_WINDOW, ENERGY_GAP, MAD_SCALE, hampel_rule
+
+try:
+    import pyarrow  # noqa: F401 -- only needed for the faster CSV engine
+
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# HPC daily files: epoch seconds in "Date", one kW reading per power unit
+HPC_DTYPES = {"Date": "int64"}
+HPC_LOAD_DTYPE = "float32"
+
+# per-PDU statistics --rank can order the power units by
+RANK_METRICS = ["mean", "max", "p95", "energy"]
+
+# --scan flags a power unit when any of its scores reaches 1: more than
+# SPIKES_PER_DAY outliers that are also SPIKE_SIGMAS times its usual noise off
+# (the rule alone replaces a few percent of ordinary readings), a level shift
+# between the STEP_WINDOW readings before and after a point STEP_SIGMAS of its
+# usual shifts above the largest one noise alone reaches over that many points
+# (about sqrt(2 ln n) of them for n independent windows), or FLATLINE_HOURS of
+# identical readings
+SPIKE_SIGMAS = 10.0
+SPIKES_PER_DAY = 1.0
+STEP_WINDOW = 36
+STEP_SIGMAS = 2.5
+FLATLINE_HOURS = 2.0
+SCAN_BLOCK = 8192  # rows per block of the rolling medians, bounds their memory
+
+# top of the group tree and its children, one per rack unit list of get_headers(0..3)
+GROUP_TREE_ROOT = "Rack units total"
+SERIES_NODES = ["A-series total", "B-series total", "D-series total", "Other rack units total"]
 
 
 def get_headers(*args):
@@ -128,6 +163,56 @@ def get_headers(*args):
         raise TypeError("get_headers() only takes zero or one argument")
 
 
+def group_tree():
+    # Nests the rack power units of get_headers(0..3) as {node: [children]}:
+    # "Rack units total" -> "A-series total" -> "Row A4" -> "PDU-A4-1".
+    # The row comes from the unit name; units without one (UPS-PDU1, SW-EPS1)
+    # get a row of their own so every unit sits at the same depth.
+    tree = {GROUP_TREE_ROOT: SERIES_NODES}
+    for option, series in enumerate(SERIES_NODES):
+        tree[series] = []
+        for unit in get_headers(option):
+            match = re.match(r"PDU-([A-Z]\d+)-\d+$", unit)
+            row = f"Row {match.group(1) if match else unit}"
+            if row not in tree:
+                tree[row] = []
+                tree[series].append(row)
+            tree[row].append(unit)
+    return tree
+
+
+class GroupTotals:
+    # Per-bucket load of every node of a group tree. All nodes are summed
+    # bottom-up in one pass per bucket resolution (rows from units, series from
+    # rows, the root from series) and cached, so asking for "A-series total"
+    # after any other node costs a dictionary lookup, not 20 column reads.
+    def __init__(self, frame: pd.DataFrame, tree: Optional[dict[str, list[str]]] = None):
+        self.tree = tree or group_tree()
+        self.levels = [[GROUP_TREE_ROOT]]  # root first, units last
+        while any(node in self.tree for node in self.levels[-1]):
+            self.levels.append([child for node in self.levels[-1] for child in self.tree[node]])
+        self.frame = frame.reindex(columns=self.levels[-1])
+        self.cache: dict[int, pd.DataFrame] = {}  # resolution in seconds -> one column per node
+
+    def totals(self, resolution: int) -> pd.DataFrame:
+        if resolution not in self.cache:
+            # a unit that did not report in a bucket counts as 0, like vis.py
+            # buckets start from local midnight, whole days follow the calendar across DST changes
+            local = self.frame.tz_convert(tz.tzlocal())
+            buckets = local.resample(f"{resolution // 86400}D" if resolution % 86400 == 0 else f"{resolution}s").mean()
+            values = np.nan_to_num(buckets.to_numpy(dtype="float64"))
+            columns = {name: values[:, i] for i, name in enumerate(self.levels[-1])}
+            for parents in reversed(self.levels[:-1]):
+                sizes = [len(self.tree[parent]) for parent in parents]
+                values = np.add.reduceat(values, np.cumsum([0] + sizes[:-1]), axis=1)
+                columns.update({name: values[:, i] for i, name in enumerate(parents)})
+            self.cache[resolution] = pd.DataFrame(columns, index=buckets.index)
+        return self.cache[resolution]
+
+    def node(self, name: str, resolution: int) -> pd.Series:
+        return self.totals(resolution)[name]
+
+
 # USAGE: -g GROUP -d DAYS -p POINTS [-s START] [-e END] [-a] [-m]
 def parse_cli_args(csv_headers):
     parser = argparse.ArgumentParser(
@@ -142,6 +227,15 @@ def parse_cli_args(csv_headers):
             raise argparse.ArgumentTypeError(f"not a valid date: {str!r}")
         return timestamp
 
+    def positive_int(number):
+        try:
+            int_number = int(number)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid integer value: {number!r}")
+        if int_number < 1:
+            raise argparse.ArgumentTypeError(f"N must be >= 1; got {number}")
+        return int_number
+
     def greater_than_2_hours_float(number):
         try:
             float_number = float(number)
@@ -197,6 +291,45 @@ def parse_cli_args(csv_headers):
         action="store_true",
         help="omit labels on every data point",
     )
+    parser.add_argument(
+        "--data-dir",
+        dest="data_dir",
+        default=".",
+        help="directory holding the daily HPC csv files",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="time the pandas loader against the legacy vis.py loader and exit",
+    )
+    parser.add_argument(
+        "--rank",
+        dest="rank",
+        type=positive_int,
+        metavar="N",
+        help="print the N rack power units with the highest --rank-by over the period and exit",
+    )
+    parser.add_argument(
+        "--rank-by",
+        dest="rank_by",
+        choices=RANK_METRICS,
+        default="max",
+        help="statistic --rank orders the power units by",
+    )
+    parser.add_argument(
+        "--scan",
+        dest="scan",
+        type=positive_int,
+        metavar="N",
+        help="print the N rack power units whose readings look most anomalous (spikes, level steps, flatlines) over the period and exit",
+    )
+    parser.add_argument(
+        "--total",
+        dest="total",
+        choices=list(group_tree()),
+        metavar="NODE",
+        help="print the per-point load of a group tree node (e.g. 'A-series total', 'Row B3') and exit",
+    )
 
     group_graphing = parser.add_mutually_exclusive_group()
     group_graphing.add_argument(
@@ -350,68 +483,274 @@ def file_names_in_range(start: str, end: str):
 
     return [f for _, f in sorted(files)]
 
-def get_file_names_pandas():
-    pass #TODO use pandas
-
-
-# below is a function that does what it says for all csvs in a path.
-# The goal is to get one big dataframe, then use pandas functions to fix any other problems - Ben 5-28-25
-# heavily "borrowed" from https://stackoverflow.com/questions/20906474/import-multiple-csv-files-into-pandas-and-concatenate-into-one-dataframe
-def combine_csv_to_dataframe(path):
-    all_files = glob.glob(os.path.join(path,"/*.csv"))
-    li = []
-
-    for filename in all_files:
-        df = pd.read_csv(filename, index_col = None, header=0) #ToDo: learn what this does
-        li.append(df)
-    
-    frame = pd.concat(li, axis=0, ignore_index=True)
-    return(frame)
-    #note that they go on to explain how to add a new column identifying each sample
-
-
-def parse_HPC(group_name: str, search_config: dict[str, Any]):
-    # TODO: check logic and make the function more resilient
-    # TODO: use PANDAS
+def to_epoch(date) -> float:
+    # search_config dates are naive local times, or plain dates when -s is omitted
+    if not isinstance(date, dt.datetime):
+        date = dt.datetime.combine(date, dt.time())
+    return date.timestamp()
+
+
+def get_file_names_pandas(search_config: dict[str, Any], data_dir: str = "."):
+    # Prunes the daily partitions by the date in their file name,
+    # so files outside the search window are never opened.
+    paths = sorted(pathlib.Path(data_dir).glob("*-*-*.csv"))
+    file_dates = pd.to_datetime(
+        pd.Series([path.stem for path in paths], dtype="string"),
+        format="%Y-%m-%d",
+        errors="coerce",
+    )
+    start = pd.Timestamp(search_config["startDate"]).normalize()
+    end = pd.Timestamp(search_config["endDate"])
+    in_range = file_dates.between(start, end).to_numpy()
+    return [str(path) for path, keep in zip(paths, in_range) if keep]
+
+
+def read_hpc_csv(path: str, columns: list[str], start: float, end: float):
+    # Reads only the requested columns with fixed dtypes and keeps the rows
+    # whose timestamp falls in [start, end]. Columns a file does not have yet
+    # (e.g. the annex before 2024-02-16) come back as NaN.
+    with open(path, "r") as f:
+        header = next(csv.reader(f), [])
+    present = [column for column in columns if column in header]
+    dtypes = {**HPC_DTYPES, **{column: HPC_LOAD_DTYPE for column in present}}
+    df = pd.read_csv(path, usecols=["Date", *present], dtype=dtypes, engine=CSV_ENGINE)
+    df = df[(df["Date"] >= start) & (df["Date"] <= end)]
+    return df.reindex(columns=["Date", *columns])
+
+
+# Used to glob "/*.csv" and concatenate every file with inferred dtypes - Ben 5-28-25
+# Now it takes the pruned partition list and the columns parse_HPC() needs.
+def combine_csv_to_dataframe(files: list[str], columns: list[str], search_config: dict[str, Any]):
+    start = to_epoch(search_config["startDate"])
+    end = to_epoch(search_config["endDate"])
+    frames = [read_hpc_csv(file, columns, start, end) for file in files]
+    if not frames:
+        frames = [pd.DataFrame(columns=["Date", *columns])]
+
+    frame = pd.concat(frames, axis=0, ignore_index=True)
+    frame = frame.astype({**HPC_DTYPES, **{column: HPC_LOAD_DTYPE for column in columns}})
+    frame.index = pd.to_datetime(frame.pop("Date"), unit="s", utc=True)
+    return frame.sort_index()
+
+
+def hpc_columns(group_name: str, search_config: dict[str, Any]):
+    # Columns of the HPC files that a group needs. The main room is built
+    # from the SeaWulf UPS/Non-UPS feeds, plus the annex for the totals.
+    if group_name != "Com Center Main Room":
+        return [group_name]
+
+    columns = ["SeaWulf Main Room on UPS", "SeaWulf Main Room on Non-UPS"]
+    if not (search_config["hpcOnly"] or search_config["upsOnly"] or search_config["entOnly"]):
+        columns.append("SeaWulf Annex on UPS")
+    return columns
+
+
+def parse_HPC(group_name: str, search_config: dict[str, Any], data_dir: str = "."):
     # Parses the files from the relevant time period generated by HPC polling.
-    #     hpc_data -> {Date: [timestamps], 'group_name': [values] ...}
-    # HPC is a dictionary with an array for timestamps,
-    # and array(s) for the relevant polling data.
-    # This includes Computing Center Annex UPS and Non-UPS, if necessary.
-
-    # hpc_data = {
-    #     "Date": [],
-    #     group_name: [],
-    #     "SeaWulf Main Room on UPS": [],
-    #     "SeaWulf Main Room on Non-UPS": [],
-    #     "SeaWulf Annex on UPS": [],
-    # }
-
-    # files = file_names_in_range(search_config['startDate'].date(), search_config['endDate'].date())
-    files = get_file_names_pandas()
-    print(files)
-
-    # for file in files:
-    #     with open(file, 'r') as f:
-    #         for row in csv.DictReader(f): # TODO: use pandas
-    #             if (timestamp_in_range(row, search_config)):
-    #                 write_to_hpc_data(row, file, search_config, group_name, hpc_data)
-    
-    # return hpc_data
+    # Returns one DataFrame indexed by UTC timestamp ("Date") with a float32
+    # column per power unit, e.g. for the main room:
+    #     SeaWulf Main Room on UPS | SeaWulf Main Room on Non-UPS | SeaWulf Annex on UPS
+    # Missing readings are NaN rather than 0.
+    return parse_HPC_columns(hpc_columns(group_name, search_config), search_config, data_dir)
+
+
+def parse_HPC_columns(columns: list[str], search_config: dict[str, Any], data_dir: str = "."):
+    # Same as parse_HPC() for an explicit list of columns.
+    files = get_file_names_pandas(search_config, data_dir)
+    return combine_csv_to_dataframe(files, columns, search_config)
+
+
+def parse_HPC_legacy(group_name: str, search_config: dict[str, Any], data_dir: str = "."):
+    # The row-by-row csv.DictReader loop from vis.py, kept as the benchmark baseline.
+    start = to_epoch(search_config["startDate"])
+    end = to_epoch(search_config["endDate"])
+    columns = hpc_columns(group_name, search_config)
+    hpc_data = {"Date": [], **{column: [] for column in columns}}
+    for file in get_file_names_pandas(search_config, data_dir):
+        with open(file, "r") as f:
+            for row in csv.DictReader(f):
+                if start <= int(row["Date"]) <= end:
+                    hpc_data["Date"].append(int(row["Date"]))
+                    for column in columns:
+                        hpc_data[column].append(float(row[column]) if column in row else float(0))
+    return hpc_data
+
+
+def benchmark_loaders(group_name: str, search_config: dict[str, Any], data_dir: str = ".", repeat: int = 3):
+    # Best-of-`repeat` wall time of each loader over the same files and columns.
+    global CSV_ENGINE
+    default_engine = CSV_ENGINE
+    loaders = [("legacy vis.py (csv.DictReader)", parse_HPC_legacy, None), ("pandas (c engine)", parse_HPC, "c")]
+    if default_engine == "pyarrow":
+        loaders.append(("pandas (pyarrow engine)", parse_HPC, "pyarrow"))
+
+    files = get_file_names_pandas(search_config, data_dir)
+    size = sum(pathlib.Path(file).stat().st_size for file in files)
+    print(f"Benchmarking {len(files)} files ({size / 1e6:.1f} MB), columns {hpc_columns(group_name, search_config)}")
+    for name, loader, engine in loaders:
+        CSV_ENGINE = engine or default_engine
+        best = float("inf")
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            result = loader(group_name, search_config, data_dir)
+            best = min(best, time.perf_counter() - begin)
+        rows = len(result["Date"]) if isinstance(result, dict) else len(result)
+        print(f"    {name:<32} {best:8.3f} s  {rows / best:12,.0f} rows/s")
+    CSV_ENGINE = default_engine
+
+
+def rank_power_units(search_config: dict[str, Any], data_dir: str = ".", top: int = 10, by: str = "max"):
+    # Loads every rack power unit (get_headers(0..3)) over the period once as a
+    # time x unit array and reduces all columns at once. Energy is the
+    # trapezoidal integral in kWh between each unit's consecutive readings, like
+    # vis.py's bucket_energy(): missing readings are stepped over, but spans
+    # longer than ENERGY_GAP are left out.
+    columns = [unit for option in range(4) for unit in get_headers(option)]
+    frame = parse_HPC_columns(columns, search_config, data_dir)
+    values = frame.to_numpy(dtype="float64")
+    seconds = frame.index.as_unit("s").asi8
+
+    stats = pd.DataFrame(index=columns)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # units with no readings at all
+        stats["mean"] = np.nanmean(values, axis=0)
+        stats["max"] = np.nanmax(values, axis=0)
+        stats["p95"] = np.nanpercentile(values, 95, axis=0)
+    previous = pd.DataFrame(values).ffill().shift().to_numpy()  # each unit's last reading before
+    since = seconds[:, None] - pd.DataFrame(np.where(np.isnan(values), np.nan, seconds[:, None])).ffill().shift().to_numpy()
+    spanned = np.where(since <= ENERGY_GAP, since, 0)
+    stats["energy"] = np.nansum((previous + values) / 2 * spanned / 3600, axis=0)
+    stats["samples"] = np.count_nonzero(~np.isnan(values), axis=0)
+
+    metric = np.nan_to_num(stats[by].to_numpy(), nan=-np.inf)
+    top = min(top, len(columns))
+    best = np.argpartition(-metric, top - 1)[:top]
+    best = best[np.argsort(-metric[best])]
+    return stats.iloc[best]
+
+
+def hampel_outliers(values: np.ndarray):
+    # Spikes of every column of a time x unit array by cleaning.py's rule, with
+    # the series mirrored at both ends like vis.py's HampelFilter. Returns the
+    # outlier mask and each reading's difference from its rolling median. A
+    # window holding a missing reading flags nothing.
+    half = CLEAN_WINDOW // 2
+    if len(values) <= half:
+        return np.zeros(values.shape, dtype=bool), np.zeros(values.shape)
+    padded = np.pad(values, ((half, half), (0, 0)), mode="reflect")
+    outliers = np.zeros(values.shape, dtype=bool)
+    residuals = np.zeros(values.shape)
+    for begin in range(0, len(values), SCAN_BLOCK):
+        block = padded[begin : begin + SCAN_BLOCK + 2 * half]
+        windows = np.lib.stride_tricks.sliding_window_view(block, CLEAN_WINDOW, axis=0)
+        center = values[begin : begin + SCAN_BLOCK]
+        median, outliers[begin : begin + SCAN_BLOCK] = hampel_rule(windows, center)
+        residuals[begin : begin + SCAN_BLOCK] = center - median
+    return outliers, residuals
+
+
+def level_steps(values: np.ndarray, seconds: np.ndarray):
+    # Change-point score of every column: the largest difference between the
+    # means of the STEP_WINDOW readings before and after a point, from running
+    # sums, in units of the column's usual differences (the scaled MAD of all of
+    # them), so daily load swings do not count as steps. Points whose windows
+    # span a polling gap are skipped. The largest of many scores is large by
+    # chance alone, so each column's threshold grows with the number of
+    # independent windows tested. Returns (step in kW, score, row of the step,
+    # threshold of the score).
+    n, width = values.shape
+    if n < 2 * STEP_WINDOW:
+        return np.zeros(width), np.zeros(width), np.zeros(width, dtype=np.int64), np.full(width, STEP_SIGMAS)
+    present = ~np.isnan(values)
+    sums = np.concatenate((np.zeros((1, width)), np.cumsum(np.where(present, values, 0), axis=0)))
+    counts = np.concatenate((np.zeros((1, width)), np.cumsum(present, axis=0)))
+    W = STEP_WINDOW
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # units with no readings at all
+        before = (sums[W:-W] - sums[: -2 * W]) / (counts[W:-W] - counts[: -2 * W])
+        after = (sums[2 * W :] - sums[W:-W]) / (counts[2 * W :] - counts[W:-W])
+        steps = after - before
+        interval = np.median(np.diff(seconds))
+        steps[seconds[2 * W - 1 :] - seconds[: n - 2 * W + 1] > 1.5 * (2 * W - 1) * interval] = np.nan
+        spread = MAD_SCALE * np.nanmedian(np.abs(steps - np.nanmedian(steps, axis=0)), axis=0)
+    rows = np.argmax(np.nan_to_num(np.abs(steps), nan=-1), axis=0)
+    step = np.nan_to_num(steps[rows, np.arange(width)])
+    score = np.where(np.nan_to_num(spread) > 0, np.abs(step) / spread, 0)  # never changing: nothing to score
+    windows = np.maximum(np.count_nonzero(~np.isnan(steps), axis=0) / W, 1)
+    return step, score, rows + W, np.sqrt(2 * np.log(windows)) + STEP_SIGMAS
+
+
+def flatlines(values: np.ndarray):
+    # Longest run of identical consecutive readings of every column, as
+    # (readings in the run, row where it ends). Missing readings break a run.
+    same = np.diff(values, axis=0) == 0
+    runs = np.cumsum(same, axis=0)
+    runs = runs - np.maximum.accumulate(np.where(same, 0, runs), axis=0)  # reset at every change
+    if not len(runs):
+        return np.zeros(values.shape[1], dtype=np.int64), np.zeros(values.shape[1], dtype=np.int64)
+    return runs.max(axis=0) + 1, runs.argmax(axis=0) + 1
+
+
+def scan_power_units(search_config: dict[str, Any], data_dir: str = ".", top: int = 10):
+    # Loads every rack power unit (get_headers(0..3)) over the period once as a
+    # time x unit array and scores all columns at once against their own
+    # recent readings: spikes found by cleaning.py's rule, the largest level
+    # step and the longest flatline. The score is the largest of the three
+    # relative to its threshold, so units at 1 or above are flagged.
+    columns = [unit for option in range(4) for unit in get_headers(option)]
+    frame = parse_HPC_columns(columns, search_config, data_dir)
+    values = frame.to_numpy(dtype="float64")
+    seconds = frame.index.as_unit("s").asi8
+    samples = np.count_nonzero(~np.isnan(values), axis=0)
+    interval = np.median(np.diff(seconds)) if len(values) > 1 else 300  # seconds between polls
+
+    def local_times(rows):
+        return [dt.datetime.fromtimestamp(seconds[row]) if len(seconds) else pd.NaT for row in rows]
+
+    outliers, residuals = hampel_outliers(values)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # units with no readings at all
+        noise = MAD_SCALE * np.nanmedian(np.abs(residuals), axis=0)
+        distance = np.where(outliers, np.abs(residuals) / noise, 0)  # in the unit's usual noise
+    step, step_score, step_rows, step_limit = level_steps(values, seconds)
+    flat, flat_rows = flatlines(values)
+    days = max(len(values) * interval / 86400, 1)
+
+    scores = pd.DataFrame(index=columns)
+    scores["outliers"] = outliers.sum(axis=0)  # what vis.py's cleaning would replace
+    scores["spikes"] = np.count_nonzero(distance > SPIKE_SIGMAS, axis=0)
+    scores["worst_spike"] = np.nan_to_num(distance).max(axis=0, initial=0)
+    scores["step_kw"] = step
+    scores["step_sigmas"] = step_score
+    scores["step_at"] = local_times(step_rows)
+    scores["flat_hours"] = flat * interval / 3600
+    scores["flat_until"] = local_times(flat_rows)
+    scores["samples"] = samples
+    scores["score"] = np.maximum.reduce(
+        [scores["spikes"] / days / SPIKES_PER_DAY, scores["step_sigmas"] / step_limit, scores["flat_hours"] / FLATLINE_HOURS]
+    )
+    scores.loc[samples == 0, "score"] = np.nan  # nothing to judge, ranked last
 
+    metric = np.nan_to_num(scores["score"].to_numpy(), nan=-np.inf)
+    top = min(top, len(columns))
+    worst = np.argpartition(-metric, top - 1)[:top]
+    worst = worst[np.argsort(-metric[worst], kind="stable")]
+    return scores.iloc[worst]
 
 
 def main():
     locale.setlocale(locale.LC_ALL, "en_US")
     csv_headers = get_headers()
     args = parse_cli_args(csv_headers)
+    # --total, --rank and --scan read every rack power unit, whatever the group
+    all_units = args.total is not None or args.rank is not None or args.scan is not None
 
-    if args.group == None:
+    if args.group == None and not all_units:
         option = prompt_missing_group_category()
         power_unit_list = get_headers(option)
         args.group = prompt_missing_group(power_unit_list)
 
-    if args.group == "Com Center Main Room":
+    if args.group == "Com Center Main Room" and not all_units:
         search_config = prompt_com_center_main_room()
     else:
         search_config = {
@@ -439,10 +778,39 @@ def main():
     """
     )
 
-    parse_HPC(args.group, search_config)
+    if args.benchmark:
+        benchmark_loaders(args.group, search_config, args.data_dir)
+        return
+
+    if args.total is not None:
+        span = to_epoch(search_config["endDate"]) - to_epoch(search_config["startDate"])
+        resolution = max(int(span // args.num_points), 1)
+        units = [unit for option in range(4) for unit in get_headers(option)]
+        group_totals = GroupTotals(parse_HPC_columns(units, search_config, args.data_dir))
+        print(group_totals.node(args.total, resolution).round(3).to_string())
+        return
+
+    if args.rank is not None:
+        begin = time.perf_counter()
+        ranking = rank_power_units(search_config, args.data_dir, args.rank, args.rank_by)
+        print(f"Top {len(ranking)} rack power units by {args.rank_by} (kW, energy in kWh):")
+        print(ranking.round(3).to_string())
+        print(f"Ranked in {time.perf_counter() - begin:.2f} s")
+        return
+
+    if args.scan is not None:
+        begin = time.perf_counter()
+        report = scan_power_units(search_config, args.data_dir, args.scan)
+        flagged = report[report["score"] >= 1]
+        print(f"{len(flagged)} of the {len(report)} most anomalous rack power units reach a threshold (score >= 1):")
+        print(report.round({"worst_spike": 1, "step_kw": 3, "step_sigmas": 1, "flat_hours": 2, "score": 2}).to_string())
+        print(f"Scanned in {time.perf_counter() - begin:.2f} s")
+        return
+
+    print(get_file_names_pandas(search_config, args.data_dir))
+    hpc_data = parse_HPC(args.group, search_config, args.data_dir)
+    print(hpc_data.describe())
 
 
 if __name__ == "__main__":
     main()
-    # TODO: the path shouldn't be hard coded
-    # combine_csv_to_dataframe("/gpfs/projects/hpc_support/snmp")
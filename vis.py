@@ -1,15 +1,22 @@
 import subprocess
 import sys
 import argparse
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import concurrent.futures
 import csv
+import hashlib
+import io
+import json
+import os
 import re
 import time
 from datetime import datetime
 from datetime import timedelta
 import locale
+import multiprocessing
+import threading
+from cleaning import CLEAN_WINDOW, CLEAN_SIGMAS, ENERGY_GAP, hampel_rule
 
 # Test
 # ALL DATA IS EXPECTED TO BE IN A CSV FORMAT
@@ -20,6 +27,30 @@ FSA_LOAD = 0.523
 SIEMENS_LOAD = 1.524
 ANNEX_NONUPS = FSA_LOAD + SIEMENS_LOAD
 SCGP_LOAD = 1.248 
+ALIGN_TOLERANCE = 5 # seconds; samples of two sources closer than this are taken to be the same reading
+CHUNK_VALUE_BYTES = 8 * (2 * CLEAN_WINDOW + 6) # bytes each HPC value takes while a --max-memory chunk goes through the pipeline, mostly the cleaning windows
+DATA_DIR = '..' # where the SNMP csv files live, relative to the working directory
+SIDECAR_DIR = os.path.join(DATA_DIR, '.vis-cache') # per-file summaries built from the csv files
+COVERAGE_GAP = 3600 # seconds without an ENT/UPS sample that count as missing data
+MAX_GAP_DISCLAIMERS = 5 # more gaps than this are summarized in a single disclaimer
+SEEK_BLOCK = 1 << 16 # bytes; binary search in an export stops narrowing once the range is this small
+EXPORT_CONTEXT = 6 * 3600 # seconds of ENT/UPS rows read past both ends of a range and cleaned along with it, far more than half a cleaning window of trendlog samples
+INDEX_BLOCK = 16 # samples per block of the range indexes' block maxima/minima
+HIST_MIN = 0.01 # kW, smallest reading the sidecar histograms tell apart from zero; smaller ones share the zero bin
+HIST_GAMMA = 1.02 # ratio between consecutive histogram bin edges, i.e. about 1% relative error
+HIST_ZERO = 1 << 19 # histogram bin of readings within HIST_MIN of zero; positive readings count up from it, negative ones down
+SIDECAR_VERSION = 4 # bumped when what the sidecars store changes, so older ones are rebuilt (2: signed histogram bins, 3: merged ENT/UPS series, 4: cleaned with the neighbouring days)
+PYRAMID_BASE = 300 # seconds per tile at the finest zoom level of --html output, one HPC polling interval
+PYRAMID_FACTOR = 4 # tiles merged into one at each coarser zoom level
+PYRAMID_TOP = 1000 # stop adding zoom levels once a level has at most this many tiles
+CHART_SIZE = (19.2, 14.4) # inches of the chart
+CHART_DPI = 100 # pixels per inch of the chart
+LABEL_SIZE = 8 # points; font size of the values written next to every point
+HEATMAP_SLOT = 900 # seconds of the day per --heatmap column
+EXPORT_FORMATS = ['.csv', '.jsonl', '.parquet'] # --export picks the format from the file extension
+OUTPUT_FORMATS = ['png', 'jpg', 'pdf', 'svg'] # formats an --output target can be drawn in
+EXPORT_BATCH = 10000 # buckets per batch when streaming --export rows
+BUCKET_WIDTHS = [60, 300, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400, 2 * 86400, 7 * 86400] # wall-clock bucket widths in seconds
 SAMPLE_USE = """
 REQUIREMENTS: Make sure to load the anaconda/ module prior to running this script.
 SAMPLE COMMAND: python vis.py -g 'Com Center Main Room' -d 20 -s 01/05/2024 -p 50 -a
@@ -33,6 +64,17 @@ def valid_date(s: str) -> datetime:
     except ValueError:
         raise argparse.ArgumentTypeError(f"not a valid date: {s!r}")
 
+def valid_offset(s: str) -> str:
+    if not re.fullmatch(r'[1-9][0-9]*[dwmy]', s):
+        raise argparse.ArgumentTypeError(f"not a valid offset: {s!r} (e.g. 7d, 1w, 1m, 1y)")
+    return s
+
+def valid_target(s: str) -> tuple:
+    match = re.fullmatch(rf"({'|'.join(OUTPUT_FORMATS)})(?:@([1-9][0-9]*))?", s.lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"not a valid output: {s!r} (FORMAT[@DPI], FORMAT one of {', '.join(OUTPUT_FORMATS)}, e.g. png@30, jpg, pdf)")
+    return match.group(1), int(match.group(2) or CHART_DPI)
+
 # START OF ARG PARSING ===================================================================================================
 # USAGE: -g GROUP -d DAYS -p POINTS [-s START] [-e END] [-a] [-m]
 parser = argparse.ArgumentParser(description="Parses and visualizes SNMP power data.")
@@ -43,7 +85,21 @@ parser.add_argument('-e', '--end', dest='endDate', type=valid_date, help="the da
 parser.add_argument('-p', '--points', dest='numPoints', type=int, help="number of points to plot")
 parser.add_argument('-a', '--average', dest='avg', action='store_true', help="chart only average load")
 parser.add_argument('-m', '--max', dest='max', action='store_true', help="chart only maximum load")
+parser.add_argument('--percentile', dest='percentiles', type=float, action='append', metavar='P', help="chart the P-th percentile load of each point (e.g. 95); can be repeated, and combined with -a/-m")
+parser.add_argument('--energy', dest='energy', action='store_true', help="also chart the energy (kWh) of each point and the cumulative energy, and annotate the total")
+parser.add_argument('--compare', dest='compare', type=valid_offset, action='append', metavar='OFFSET', help="overlay the same period OFFSET earlier (e.g. 1w, 1m, 1y) on the chart, with the difference in average and max load; can be repeated")
 parser.add_argument('--clean', dest='plotClean', action='store_true', help="plot graph without values over every point")
+parser.add_argument('--html', dest='htmlOut', metavar='FILE', help="also write a self-contained zoomable HTML chart of the selected range to FILE")
+parser.add_argument('--heatmap', dest='heatmapOut', metavar='FILE', help="also draw a day x time-of-day heatmap of the load (its maximum with -m, else its average) to FILE")
+parser.add_argument('--no-sidecars', dest='noSidecars', action='store_true', help="read every raw row even when they could be answered from the per-file summaries and range indexes")
+parser.add_argument('--full', dest='fullRes', action='store_true', help="plot every sample, decimated to the figure width so short spikes stay visible, instead of per-point averages/maxima")
+parser.add_argument('--output', dest='outputs', type=valid_target, action='append', metavar='FORMAT[@DPI]', help="draw the chart once and save it as FORMAT (png, jpg, pdf or svg) at DPI (default 100) to out-HASH-DPI.FORMAT instead of out.jpg, HASH identifying the query and its data so existing files are reused; can be repeated")
+parser.add_argument('--output-workers', dest='outputWorkers', type=int, default=1, metavar='N', help="with several --output targets, save them from N worker processes")
+parser.add_argument('--export', dest='exportOut', metavar='FILE', help="write the per-bucket mean/max/min/count and disclaimers to FILE (.csv, .jsonl or .parquet) instead of drawing out.jpg")
+parser.add_argument('--jobs-file', dest='jobsFile', metavar='FILE', help="run every query listed in a JSON or YAML jobs file, reading the data they share only once")
+parser.add_argument('--explain', dest='explain', action='store_true', help="with --jobs-file, print the read plan (files, bytes, shared reads) and exit")
+parser.add_argument('--max-memory', dest='maxMemory', type=float, metavar='MB', help="read, clean, align and aggregate the HPC rows in chunks so the process stays within MB megabytes, and report the peak memory used")
+parser.add_argument('--watch', dest='watch', type=float, metavar='SECONDS', help="keep polling the HPC files every SECONDS and rewrite out.jpg whenever a time bucket changes")
 
 if len(sys.argv) == 1: # no arguments provided, print help message
     print(SAMPLE_USE)
@@ -55,7 +111,7 @@ if sys.argv[1] == '-h' or sys.argv[1] == '--help':
 args = parser.parse_args()
 upsOnly = entOnly = hpcOnly = nonmetered = False
 headerData = ''
-if args.group == None: 
+if args.group == None and args.jobsFile == None: 
     val = int(input("""Group name not specified. Please enter a value: 
     1 for Computing Center Main Room 
     2 for Computing Center Annex
@@ -105,32 +161,60 @@ if args.group == "Com Center Main Room":
         nonmetered = True
 # save = input("Would you like to save this figure? [y/n] ").lower()
 
+if args.percentiles and not all(0 <= p <= 100 for p in args.percentiles):
+    parser.error("--percentile must be between 0 and 100")
 if args.numDays != None and args.numDays < 0.08:
         parser.error("numDays cannot be smaller than 0.08 of a day")
-print("Group: {}\nStart Date: {}\nDays: {}\nAverage? {}\nMax? {}\nNumber of Points? {}".format(args.group, args.startDate, args.numDays, args.avg, args.max, args.numPoints))
-
-if(args.startDate == None):
-    endDate = datetime.now()
-    startDate = endDate - timedelta(days=float(args.numDays))
-else:
-    startDate = args.startDate
-    if args.endDate != None:
-        endDate = args.endDate
-    else:
-        endDate = startDate + timedelta(days=float(args.numDays))
-print("Start time:", startDate, "End time:", endDate)
-numDays = (endDate.date() - startDate.date()).days
+if args.watch != None:
+    if args.group == "Com Center Main Room" and not hpcOnly:
+        parser.error("--watch only follows the HPC polling files, choose a group measured there (or Main Room HPC data-only)")
+    if args.fullRes or args.htmlOut or args.heatmapOut or args.exportOut or args.percentiles or args.energy or args.compare:
+        parser.error("--watch cannot be combined with --full, --html, --heatmap, --export, --percentile, --energy or --compare")
+if args.compare and (args.fullRes or args.htmlOut or args.jobsFile):
+    parser.error("--compare cannot be combined with --full, --html or --jobs-file")
+if args.maxMemory != None and (args.watch != None or args.jobsFile or args.fullRes or args.htmlOut or args.heatmapOut or args.compare):
+    parser.error("--max-memory cannot be combined with --watch, --jobs-file, --full, --html, --heatmap or --compare, which need every sample at once")
+if args.outputs and (args.exportOut or args.watch != None):
+    parser.error("--output cannot be combined with --export or --watch")
+if args.outputWorkers < 1:
+    parser.error("--output-workers must be at least 1")
+if args.exportOut != None and os.path.splitext(args.exportOut)[1].lower() not in EXPORT_FORMATS:
+    parser.error(f"--export FILE must end in one of {', '.join(EXPORT_FORMATS)}")
+if args.explain and args.jobsFile == None:
+    parser.error("--explain needs --jobs-file")
+
+def query_period(start, end, days):
+    """(startDate, endDate) of a query: days back from now without a start, otherwise from start to end or start + days."""
+    if start == None:
+        end = datetime.now()
+        return end - timedelta(days=float(days)), end
+    if end != None:
+        return start, end
+    return start, start + timedelta(days=float(days))
+
+if args.jobsFile == None: # each job sets its own period
+    print("Group: {}\nStart Date: {}\nDays: {}\nAverage? {}\nMax? {}\nNumber of Points? {}".format(args.group, args.startDate, args.numDays, args.avg, args.max, args.numPoints))
+    startDate, endDate = query_period(args.startDate, args.endDate, args.numDays)
+    print("Start time:", startDate, "End time:", endDate)
+    numDays = (endDate.date() - startDate.date()).days
 
 # END OF ARG PARSING =====================================================================================================
 # START OF READING DATA ==================================================================================================
 # input data. for more information see ./power_diagram.jpg
 hpc_data = {} # Seawulf data. Location: in the center
+hpc_schemas = None # {file name: {'size', 'mtime', 'columns'}} header of every daily HPC file, loaded from SIDECAR_DIR on first use
 ent_data = {} # Enterprise equipments power data. Location: mainroom, UPS
 ups_data = {} # UPS power data
 
 # global variables for data generated by calculations. not provided by csv.
-averages = {} # average for the power data requested by the user over the certain period
-maxes = {} # max of the power data requested by the user over the certain period
+averages = {} # {bucket start: average} for the power data requested by the user over the certain period
+maxes = {} # {bucket start: max} for the power data requested by the user over the certain period
+percentiles = {} # {P: {bucket start: P-th percentile}} for every --percentile P
+energies = {} # {bucket start: energy (kWh)} of the power data, for --energy
+comparisons = {} # {OFFSET: {'start', 'end', 'mean': {bucket start: average}, 'max': {bucket start: max}, 'summary'}} for every --compare OFFSET, by the buckets of the requested period
+counts = {} # {bucket start: number of samples behind it}, 0 for buckets with no data
+coverage_cache = None # {path: {'mtime', 'size', 'first', 'last', 'gaps'}}, loaded from SIDECAR_DIR on first use
+sidecar_stats = {} # {'HPC'/'ENT'/'UPS': {key: per-bucket stats}} for whole days answered from sidecars, or --watch's running totals
 disclaimers = [] # problems outside of our control
 
 def calc_annex_helper():
@@ -162,20 +246,334 @@ def calc_annex_helper():
     # maximum = round(max(filedata[group]), 3)
     return average
 
-def parse_HPC(): 
+def hpc_files(start, end):
+    """Daily HPC files (DATA_DIR/YYYY-MM-DD.csv) for the days from start to end, oldest first."""
+    first = datetime.fromtimestamp(start).date().isoformat()
+    last = datetime.fromtimestamp(end).date().isoformat()
+    files = []
+    for name in os.listdir(DATA_DIR):
+        match = re.match(r'^(\d{4}-\d{2}-\d{2})\.csv$', name)
+        if match and first <= match.group(1) <= last:
+            files.append(os.path.join(DATA_DIR, name))
+    return sorted(files)
+
+def export_files(prefix):
+    """ENT or UPS export files, oldest modification time first."""
+    command = f"""ls -ltr {DATA_DIR}/{prefix}* | awk '{{print $9}}'"""
+    result = subprocess.run(command, shell=True, executable="/bin/bash",
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True)
+    return result.stdout.splitlines()
+
+def ent_timestamp(text):
+    try: # for formats like 1/04/24
+        return int(time.mktime(datetime.strptime(text, "%m/%d/%y %I:%M:%S %p %Z").timetuple()))
+    except ValueError: # for formats like 1/04/2024
+        return int(time.mktime(datetime.strptime(text, "%m/%d/%Y %I:%M:%S %p %Z").timetuple()))
+
+def ent_power(value):
+    try: 
+        return 208.0 * float(value) / 1000.0
+    except ValueError: 
+        return 0
+
+def ups_timestamp(text):
+    try: 
+        return int(time.mktime(datetime.strptime(text, "%m/%d/%y %H:%M").timetuple()))
+    except ValueError: # for formats like 1/04/2024
+        return int(time.mktime(datetime.strptime(text, "%m/%d/%Y %H:%M").timetuple()))
+
+def ent_row(row):
+    return ent_timestamp(row['Time']), ent_power(row['Value'])
+
+def ent_line_timestamp(line):
+    """Timestamp of a raw line of an ENT export, None for the header or a line without a date."""
+    match = re.search(r'\d{1,2}/\d{1,2}/\d{2,4}.+?(EST|EDT)', line)
+    return ent_timestamp(match.group(0)) if match else None
+
+def ups_row(row):
+    return ups_timestamp(row['Date'] + " " + row['Time']), int(row['Watts Out (avg)']) / 1000.0
+
+def ups_line_timestamp(line):
+    """Timestamp of a raw line of a UPS export, None for the header or a line without a date."""
+    date = re.search(r'\d{1,2}/\d{1,2}/\d{2,4}', line)
+    clock = re.search(r'\d{1,2}:\d{1,2}', line)
+    return ups_timestamp(date.group(0) + " " + clock.group(0)) if date and clock else None
+
+export_readers = {'ENT': (ent_row, ent_line_timestamp, 'Com Center Main Room'), 'UPS': (ups_row, ups_line_timestamp, 'UPS_AVG')} # row reader, line timestamp and column of each trendlog
+
+# MERGING OVERLAPPING EXPORTS ==========================================
+# ENT and UPS trendlogs are exported by hand, so consecutive exports overlap and their mtimes say
+# little about what they contain. Every export is sorted by time, which lets us order them by their
+# first timestamp, binary search for the first byte of the query and stop reading past its end.
+def first_timestamp(path, line_timestamp):
+    """Timestamp of the first data line of an export, None if it has none."""
+    with open(path, 'r', errors='replace') as f:
+        f.readline() # header
+        for line in f:
+            timestamp = line_timestamp(line)
+            if timestamp is not None:
+                return timestamp
+    return None
+
+def seek_time(f, target, line_timestamp):
+    """Offset in the binary file f of a line at or shortly before the first line with a timestamp >= target."""
+    f.seek(0)
+    f.readline() # header
+    lo = f.tell()
+    hi = os.fstat(f.fileno()).st_size
+    while hi - lo > SEEK_BLOCK:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline() # partial line
+        line = f.readline().decode(errors='replace')
+        timestamp = line_timestamp(line) if line else None
+        if timestamp is not None and timestamp >= target:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+def read_export(path, ranges, row_reader, line_timestamp):
+    """(timestamps, values) of the rows of one export inside ranges, reading only the bytes around each range."""
+    timestamps, values = [], []
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode(errors='replace')]))
+        dataStart = f.tell()
+        for start, end in ranges:
+            offset = seek_time(f, start, line_timestamp)
+            f.seek(offset)
+            if offset > dataStart:
+                f.readline() # partial line
+            text = io.TextIOWrapper(f, errors='replace', newline='')
+            for row in csv.DictReader(text, fieldnames=header):
+                timestamp, value = row_reader(row)
+                if timestamp > end:
+                    break
+                if timestamp >= start:
+                    timestamps.append(timestamp)
+                    values.append(value)
+            text.detach()
+    return timestamps, values
+
+def merge_exports(files, ranges, row_reader, line_timestamp):
+    """Reads the rows inside ranges from every export into one sorted series without duplicates.
+    Exports are ordered by their first timestamp; exports that start after the last range are skipped,
+    and where exports overlap the one that starts later wins.
+    Returns (timestamps, values) as numpy arrays.
+    """
+    exports = sorted((first, file) for file in files for first in [first_timestamp(file, line_timestamp)] if first is not None)
+    runs = []
+    for first, file in reversed(exports): # newest first, so the stable sort below keeps its rows
+        wanted = [(max(start, first), end) for start, end in ranges if end >= first]
+        if wanted:
+            runs.append(read_export(file, wanted, row_reader, line_timestamp))
+    timestamps = np.array([t for run in runs for t in run[0]], dtype=np.int64)
+    values = np.array([v for run in runs for v in run[1]], dtype=float)
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, values = timestamps[order], values[order]
+    keep = np.concatenate(([True], np.diff(timestamps) != 0)) if len(timestamps) else np.zeros(0, dtype=bool)
+    return timestamps[keep], values[keep]
+
+# COVERAGE =============================================================
+# Whether the ENT/UPS trendlogs cover a request is answered from a small cache of each export's first
+# and last timestamp and internal gaps, so the disclaimers cost a stat() per export instead of a read.
+def last_timestamp(path, line_timestamp):
+    """Timestamp of the last data line of an export, None if it has none. Read by seeking backwards
+    from the end, past a truncated or garbled tail (e.g. an export still being written).
+    """
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        while position > 0:
+            step = min(SEEK_BLOCK, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + data).split(b'\n')
+            data = lines.pop(0) if position > 0 else b'' # may start mid-line, finished by the next block
+            for line in reversed(lines):
+                try:
+                    timestamp = line_timestamp(line.decode(errors='replace'))
+                except ValueError: # a date cut short
+                    continue
+                if timestamp is not None:
+                    return timestamp
+    return None
+
+def scan_gaps(path, line_timestamp):
+    """[start, end] of every stretch longer than COVERAGE_GAP without a sample in one export."""
+    with open(path, 'r', errors='replace') as f:
+        f.readline() # header
+        timestamps = np.array([t for t in map(line_timestamp, f) if t is not None], dtype=np.int64)
+    jumps = np.flatnonzero(np.diff(timestamps) > COVERAGE_GAP)
+    return [[int(timestamps[i]), int(timestamps[i + 1])] for i in jumps]
+
+def load_coverage_cache():
+    """The coverage cache, read from SIDECAR_DIR on first use."""
+    global coverage_cache
+    if coverage_cache is None:
+        try:
+            with open(os.path.join(SIDECAR_DIR, 'coverage.json'), 'r') as f:
+                coverage_cache = json.load(f)
+        except (OSError, ValueError):
+            coverage_cache = {}
+    return coverage_cache
+
+def export_coverage(path, line_timestamp, start, end):
+    """Cached {'first', 'last', 'gaps'} of one export. first/last come from its first line and a tail
+    seek; the export is read whole for its gaps once it overlaps a request, and never again until it
+    changes. Changed entries are flagged 'new' until save_coverage_cache() writes them.
+    """
+    load_coverage_cache()
+    info = os.stat(path)
+    entry = coverage_cache.get(path)
+    if entry is None or entry['mtime'] != info.st_mtime or entry['size'] != info.st_size:
+        entry = {'mtime': info.st_mtime, 'size': info.st_size, 'gaps': None,
+                 'first': first_timestamp(path, line_timestamp), 'last': last_timestamp(path, line_timestamp), 'new': True}
+    if entry['gaps'] is None and entry['last'] is not None and entry['first'] <= end and entry['last'] >= start:
+        entry['gaps'] = scan_gaps(path, line_timestamp)
+        entry['new'] = True
+    coverage_cache[path] = entry
+    return entry
+
+def save_coverage_cache():
+    """Writes the coverage cache if any entry changed since it was loaded."""
+    new = [entry.pop('new', False) for entry in coverage_cache.values()] if coverage_cache else []
+    if not any(new):
+        return
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        path = os.path.join(SIDECAR_DIR, 'coverage.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(coverage_cache, f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print("Could not write coverage cache:", e)
+
+def coverage_gaps(files, line_timestamp, start, end):
+    """(start, end) of every stretch of [start, end] longer than COVERAGE_GAP that no export covers."""
+    covered = []
+    for file in files:
+        entry = export_coverage(file, line_timestamp, start, end)
+        if entry['last'] is None or entry['first'] > end or entry['last'] < start:
+            continue
+        edges = [entry['first']] + [t for gap in entry['gaps'] for t in gap] + [entry['last']]
+        covered.extend(zip(edges[::2], edges[1::2]))
+
+    gaps = []
+    cursor = start
+    for first, last in sorted(covered):
+        if cursor >= end: # exports past the end of the period do not leave gaps in it
+            break
+        if min(first, end) - cursor > COVERAGE_GAP:
+            gaps.append((cursor, min(first, end)))
+        cursor = max(cursor, last)
+    if end - cursor > COVERAGE_GAP:
+        gaps.append((cursor, end))
+    return gaps
+
+def coverage_disclaimers(name, gaps):
+    if len(gaps) > MAX_GAP_DISCLAIMERS:
+        hours = sum(b - a for a, b in gaps) / 3600
+        return [f"Missing {name} in {len(gaps)} gaps totalling {hours:.1f} hours."]
+    return [f"Missing {name} from {datetime.fromtimestamp(a):%m/%d %H:%M} to {datetime.fromtimestamp(b):%m/%d %H:%M}." for a, b in gaps]
+
+# SCHEMA REGISTRY ======================================================
+# Columns were added to the daily HPC files over time (the annex feeds on February 16th, PDU-C4-1/2 later),
+# so every file's header is recorded once and readers look columns up by position instead of checking
+# every row. A file whose size or modification time changed has its header read again.
+def load_hpc_schemas():
+    """The schema registry, read from SIDECAR_DIR on first use."""
+    global hpc_schemas
+    if hpc_schemas is None:
+        try:
+            with open(os.path.join(SIDECAR_DIR, 'schemas.json'), 'r') as f:
+                hpc_schemas = json.load(f)
+        except (OSError, ValueError):
+            hpc_schemas = {}
+    return hpc_schemas
+
+def hpc_schema(path, header=None):
+    """{column: position} of the header of one daily HPC file. header is the file's first row when
+    the caller has read it anyway, and replaces a recorded header that no longer matches it.
+    """
+    load_hpc_schemas()
+    name = os.path.basename(path)
+    info = os.stat(path)
+    entry = hpc_schemas.get(name)
+    if (entry is None or entry['size'] != info.st_size or entry.get('mtime') != info.st_mtime
+            or header is not None and header != entry['columns']):
+        if header is None:
+            with open(path, 'r') as f:
+                header = next(csv.reader(f), [])
+        entry = {'size': info.st_size, 'mtime': info.st_mtime, 'columns': header, 'new': True}
+        hpc_schemas[name] = entry
+    return {column: i for i, column in enumerate(entry['columns'])}
+
+def save_hpc_schemas():
+    """Writes the schema registry if any header was recorded since it was loaded."""
+    new = [entry.pop('new', False) for entry in hpc_schemas.values()] if hpc_schemas else []
+    if not any(new):
+        return
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        path = os.path.join(SIDECAR_DIR, 'schemas.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(hpc_schemas, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        print("Could not write schema registry:", e)
+
+def read_hpc_columns(path, columns):
+    """(timestamps, values) of one daily HPC file, where values is (rows x columns) in the order asked for.
+    Columns the file does not have are NaN, as are empty readings.
+    """
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        schema = hpc_schema(path, header)
+        present = [i for i, column in enumerate(columns) if column in schema]
+        positions = [schema['Date']] + [schema[columns[i]] for i in present]
+        table = np.array([[row[i] or 'nan' for i in positions] for row in reader if len(row) == len(header)], dtype=float)
+    table = table.reshape(-1, len(positions))
+    values = np.full((len(table), len(columns)), np.nan)
+    values[:, present] = table[:, 1:]
+    return table[:, 0].astype(np.int64), values
+
+def check_coverage(files, line_timestamp, name):
+    """Adds a disclaimer for every gap in the exports' coverage of the requested period, to those of
+    the source being loaded while load_source() runs. Returns False when they have no data for it at all.
+    """
+    gaps = coverage_gaps(files, line_timestamp, startDate.timestamp(), endDate.timestamp())
+    getattr(loading, 'disclaimers', disclaimers).extend(coverage_disclaimers(name, gaps))
+    return gaps != [(startDate.timestamp(), endDate.timestamp())]
+
+def hpc_columns():
+    """Columns of the daily HPC files that args.group is computed from."""
+    if args.group == 'Com Center Main Room':
+        return ['SeaWulf Main Room on UPS', 'SeaWulf Main Room on Non-UPS', 'SeaWulf Annex on UPS']
+    return [args.group]
+
+def parsed_columns():
+    """Columns parse_HPC() reads: those of hpc_columns(), without the annex unless the Main Room total or nonmetered needs it."""
+    columns = hpc_columns()
+    if args.group == 'Com Center Main Room' and (hpcOnly or upsOnly or entOnly): # ANNEX DATA ONLY REQUIRED FOR NONMETERED CALCULATIONS AND TOTALS
+        columns.remove('SeaWulf Annex on UPS')
+    return columns
+
+def parse_HPC(ranges=None): 
     """Parses the files from the relevant time period generated by HPC polling. The following are modified:
         hpc_data -> {Date: [timestamps], 'args.group': [values] ...}
     HPC is a dictionary with an array for timestamps, and array(s) for the relevant polling data.
-    This includes Computing Center Annex UPS and Non-UPS, if necessary. 
+    This includes Computing Center Annex UPS and Non-UPS, if necessary. Readings from days before a
+    column existed (e.g. the annex before February 16th) are NaN.
+    ranges is a list of (start, end) timestamps to read, the whole requested period by default.
     """
-    # bash code to filter through CSV files within time range specified
+    if ranges is None:
+        ranges = [(startDate.timestamp(), endDate.timestamp())]
     print("\nPARSING HPC DATA... (default, must be parsed for all options)")
-    command = f"""ls -lt ../*-*-*csv | awk '{{print $9}}' | sed -n '/{endDate.date()}/, /{startDate.date()}/p' | tac"""
-    result = subprocess.run(command, shell=True, executable="/bin/bash",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True)
-    files = result.stdout.splitlines()
+    files = sorted(set(file for start, end in ranges for file in hpc_files(start, end)))
     print(files)
 
     # array to append data extracted from the CSV
@@ -185,152 +583,504 @@ def parse_HPC():
     hpc_data['SeaWulf Main Room on Non-UPS'] = []
     hpc_data['SeaWulf Annex on UPS'] = []
 
+    columns = parsed_columns()
     for file in files: # reading through every file
-        matches = re.split(r'^../(\d{4})-(\d{2})-(\d{2})\.csv$', file)[1:4] # making sure file name matches expected format
-        if matches:
-            with open(file, 'r') as f:
-                reader = csv.DictReader(f) # reads every row in the csv into dict
-                for row in reader:
-                    if (datetime.timestamp(startDate) <= int(row['Date']) and datetime.timestamp(endDate) >= int(row['Date'])): # timestamp in range
-                        hpc_data['Date'].append(int(row['Date'])) # append values
-                        if args.group not in row:
-                            hpc_data[args.group].append(float(0))
-                        if (args.group == 'Com Center Main Room'): #FOR COMPUTING CENTER MAIN ROOM CAlCUlATIONS, RECORD
-                            hpc_data['SeaWulf Main Room on UPS'].append(float(row['SeaWulf Main Room on UPS']))
-                            hpc_data['SeaWulf Main Room on Non-UPS'].append(float(row['SeaWulf Main Room on Non-UPS']))
-                            hpc_data[args.group].append(float(row['SeaWulf Main Room on UPS']) + float(row['SeaWulf Main Room on Non-UPS']))
-                            if (not hpcOnly and not upsOnly and not entOnly): # ANNEX DATA REQUIRED FOR NONMETERED CALCULATIONS
-                                if (file >= '2024-02-16.csv'): # ANNEX DATA EXISTS
-                                    hpc_data['SeaWulf Annex on UPS'].append(float(row['SeaWulf Annex on UPS']))
-                                else:
-                                    hpc_data['SeaWulf Annex on UPS'].append(float(0))
-                        else: 
-                            hpc_data[args.group].append(float(row[args.group]))
-
-def parse_ENT():
+        timestamps, values = read_hpc_columns(file, columns)
+        values = clean_day(day_context(file), columns, values)
+        keep = np.zeros(len(timestamps), dtype=bool)
+        for start, end in ranges: # timestamp in range
+            keep |= (timestamps >= start) & (timestamps <= end)
+        hpc_data['Date'].extend(timestamps[keep].tolist())
+        for i, column in enumerate(columns):
+            hpc_data[column].extend(values[keep, i].tolist())
+    if args.group == 'Com Center Main Room': #FOR COMPUTING CENTER MAIN ROOM CAlCUlATIONS, RECORD
+        hpc_data[args.group] = (np.array(hpc_data['SeaWulf Main Room on UPS']) + np.array(hpc_data['SeaWulf Main Room on Non-UPS'])).tolist()
+
+def parse_ENT(ranges=None):
     """Parses the files from the relevant time period from Enterprise logs. The following are modified:
         ent_data -> {Date: [timestamps], 'args.group': [values]}
     ent_data is a dictionary with an array for timestamps, and array for relevant data.
+    ranges is a list of (start, end) timestamps to read, the whole requested period by default.
     """
-    
+    if ranges is None:
+        ranges = [(startDate.timestamp(), endDate.timestamp())]
     print("\nPARSING ENT DATA...")
-    read = True
-    # bash code to filter through ENT files
-    command = f"""ls -ltr ../ENT* | awk '{{print $9}}'"""
-    result = subprocess.run(command, shell=True, executable="/bin/bash",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True)
-    files = result.stdout.splitlines()
+    read = bool(ranges)
+    files = export_files('ENT')
     print(files)
     
-    with open (files[-1], 'r') as lastFile: # finding the last recorded date for ENT files
-        lastEntry = lastFile.readlines()[-1]
-        if(re.search(r'\d{1,2}/\d{1,2}/\d{2,4}.+EST', lastEntry) == None):
-            date = re.search(r'\d{1,2}/\d{1,2}/\d{2,4}.+EDT', lastEntry).group(0)
-        else:
-            date = re.search(r'\d{1,2}/\d{1,2}/\d{2,4}.+EST', lastEntry).group(0)
-        try: # for formats like 1/04/24
-            last = int(time.mktime(datetime.strptime(date, "%m/%d/%y %I:%M:%S %p %Z").timetuple()))
-        except: # for formats like 1/04/2024
-            last = int(time.mktime(datetime.strptime(date, "%m/%d/%Y %I:%M:%S %p %Z").timetuple()))
-        if last < datetime.timestamp(startDate): # if the last recorded date is before the requested time period
-            read = False  # do not read ENT files
-        if last < datetime.timestamp(endDate):
-            disclaimers.append("Missing Enterprise aisle equipment data for the time period.")
+    if not check_coverage(files, ent_line_timestamp, "Enterprise aisle equipment data"): # no ENT data for the requested time period
+        read = False  # do not read ENT files
 
     # array to append data extracted from the CSV, specifically the timestamp
     ent_data['Date'] = []
     ent_data[args.group] = [] # arguments parsed from the reader
     if read:
-        latestTime = None # latest time in each ENT file, for checking overlaps
-        for file in files:
-            with open(file, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    try: 
-                        timestamp = int(time.mktime(datetime.strptime(row['Time'], "%m/%d/%y %I:%M:%S %p %Z").timetuple()))
-                    except: 
-                        timestamp = int(time.mktime(datetime.strptime(row['Time'], "%m/%d/%Y %I:%M:%S %p %Z").timetuple()))
-                    if latestTime != None and latestTime > timestamp or timestamp < startDate.timestamp() or timestamp > endDate.timestamp():
-                        continue
-                    try: 
-                        power = 208.0 * float(row['Value']) / 1000.0
-                    except: 
-                        power = 0
-                    ent_data['Date'].append(timestamp)
-                    ent_data[args.group].append(power)
-                latestTime = timestamp
-
-def parse_UPS():
+        timestamps, power = read_trendlog('ENT', files, ranges)
+        ent_data['Date'] = timestamps.tolist()
+        ent_data[args.group] = power.tolist()
+
+def parse_UPS(ranges=None):
     """Parses the files from the relevant time period from UPS logs. The following are modified:
         ups_data -> {Date: [timestamps], 'args.group': [values]}
     ups_data is a dictionary with an array for timestamps, and array for relevant data.
+    ranges is a list of (start, end) timestamps to read, the whole requested period by default.
     """
+    if ranges is None:
+        ranges = [(startDate.timestamp(), endDate.timestamp())]
     ups_data['Date'] = []
     ups_data['UPS_AVG'] = []
     # ups_data['UPS_MAX'] = []
     
     print("\nPARSING UPS DATA...")
-    read = True
-    # bash code to filter through UPS files
-    command = f"""ls -ltr ../UPS* | awk '{{print $9}}'"""
-    result = subprocess.run(command, shell=True, executable="/bin/bash",
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True)
-    files = result.stdout.splitlines()
+    read = bool(ranges)
+    files = export_files('UPS')
     print(files)
     
-    with open (files[-1], 'r') as lastFile: # finding the last recorded date for UPS files
-        lastEntry = lastFile.readlines()[-1]
-        date = re.search(r'\d{1,2}/\d{1,2}/\d{2,4}', lastEntry).group(0)
-        reTime = re.search(r'\d{1,2}:\d{1,2}', lastEntry).group(0)
-        date += " " + reTime
-        try:
-            last = int(time.mktime(datetime.strptime(date, "%m/%d/%y %H:%M").timetuple()))
-        except: # for formats like 1/04/2024
-            last = int(time.mktime(datetime.strptime(date, "%m/%d/%Y %H:%M").timetuple()))
-        if last < datetime.timestamp(startDate): # if the last recorded date is before the requested time period
-            read = False  # do not read ups files
-        if last < datetime.timestamp(endDate):
-            disclaimers.append("Missing UPS trendlog for the time period.")
+    if not check_coverage(files, ups_line_timestamp, "UPS trendlog"): # no UPS data for the requested time period
+        read = False  # do not read ups files
 
     if read:
-        latestTime = None # latest time in each UPS file, for checking overlaps
-        for file in files:
-            with open(file, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    timestring = row['Date'] + " " + row['Time']
-                    try: 
-                        timestamp = int(time.mktime(datetime.strptime(timestring, "%m/%d/%y %H:%M").timetuple()))
-                    except: 
-                        timestamp = int(time.mktime(datetime.strptime(timestring, "%m/%d/%Y %H:%M").timetuple()))
-                    if latestTime != None and latestTime > timestamp or timestamp < startDate.timestamp() or timestamp > endDate.timestamp():
+        timestamps, power = read_trendlog('UPS', files, ranges)
+        ups_data['Date'] = timestamps.tolist()
+        ups_data['UPS_AVG'] = power.tolist()
+
+# SIDECAR SUMMARIES ====================================================
+# Every data file gets a small JSON sidecar in SIDECAR_DIR with mergeable per-day statistics of each
+# cleaned column, rebuilt whenever the file's mtime or size changes. Queries with day-sized buckets
+# take the days they fully cover from the sidecars and only read raw rows for the partial days at the edges.
+def read_hpc_file(path):
+    """Every column of a daily HPC file as (timestamps, {column: values}), NaN where a reading is empty."""
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        table = np.array([[float(v) if v else np.nan for v in row] for row in reader if len(row) == len(header)])
+    table = table.reshape(-1, len(header))
+    date = header.index('Date')
+    return table[:, date].astype(np.int64), {column: table[:, i] for i, column in enumerate(header) if i != date}
+
+def histogram_bins(values):
+    """Fixed log-spaced histogram bin of each value, in the order of the values: bin HIST_ZERO + k holds
+    positive values up to HIST_MIN * HIST_GAMMA**k, HIST_ZERO - k negative ones down to minus that, and
+    HIST_ZERO itself values within HIST_MIN of zero. Like DDSketch's separate positive and negative
+    stores, so derived loads that can be zero or negative (e.g. nonmetered) keep their sign.
+    """
+    values = np.asarray(values, dtype=float)
+    k = np.ceil(np.log(np.maximum(np.abs(values), HIST_MIN) / HIST_MIN) / np.log(HIST_GAMMA)).astype(np.int64)
+    return HIST_ZERO + np.sign(values).astype(np.int64) * k
+
+def bin_value(bins):
+    """Value a histogram_bins() bin stands for: the midpoint of its edges, 0 for HIST_ZERO."""
+    k = np.asarray(bins, dtype=np.int64) - HIST_ZERO
+    return np.sign(k) * HIST_MIN * HIST_GAMMA ** np.abs(k) * 2 / (1 + HIST_GAMMA)
+
+def summarize(timestamps, columns):
+    """Per-day statistics of each column of one file's cleaned rows:
+        {date: {'start': midnight, 'rows': n, 'columns': {column: {count, sum, sumsq, min, max, first, last, bins, counts}}}}
+    bins/counts is a sparse histogram over histogram_bins(). Every field merges across files by adding or taking min/max.
+    """
+    order = np.argsort(timestamps, kind='stable')
+    timestamps = timestamps[order]
+    if not len(timestamps):
+        return {}
+    midnights = local_midnights(timestamps[0], timestamps[-1])
+    day = np.searchsorted(midnights, timestamps, side='right') - 1
+    rows = np.bincount(day, minlength=len(midnights) - 1)
+    days = {datetime.fromtimestamp(midnights[d]).date().isoformat(): {'start': int(midnights[d]), 'rows': int(rows[d]), 'columns': {}}
+            for d in np.flatnonzero(rows)}
+    for column, values in columns.items():
+        values = np.asarray(values, dtype=float)[order]
+        valid = ~np.isnan(values)
+        times, values, dayOf = timestamps[valid], values[valid], day[valid]
+        stats = bucket_stats(times, values, midnights)
+        squares = bucket_stats(times, values ** 2, midnights)['sum']
+        seen = bucket_stats(times, times.astype(float), midnights)
+        bins = histogram_bins(values)
+        for d in np.flatnonzero(stats['count']):
+            binIds, binCounts = np.unique(bins[dayOf == d], return_counts=True)
+            days[datetime.fromtimestamp(midnights[d]).date().isoformat()]['columns'][column] = {
+                'count': int(stats['count'][d]), 'sum': float(stats['sum'][d]), 'sumsq': float(squares[d]),
+                'min': float(stats['min'][d]), 'max': float(stats['max'][d]),
+                'first': int(seen['min'][d]), 'last': int(seen['max'][d]),
+                'bins': binIds.tolist(), 'counts': binCounts.tolist(),
+            }
+    return days
+
+def merge_summaries(a, b):
+    """Merges the statistics of one column (or None) from two files."""
+    if a is None or b is None:
+        return a or b
+    histogram = dict(zip(a['bins'], a['counts']))
+    for binId, count in zip(b['bins'], b['counts']):
+        histogram[binId] = histogram.get(binId, 0) + count
+    return {
+        'count': a['count'] + b['count'], 'sum': a['sum'] + b['sum'], 'sumsq': a['sumsq'] + b['sumsq'],
+        'min': min(a['min'], b['min']), 'max': max(a['max'], b['max']),
+        'first': min(a['first'], b['first']), 'last': max(a['last'], b['last']),
+        'bins': sorted(histogram), 'counts': [histogram[binId] for binId in sorted(histogram)],
+    }
+
+def load_sidecar(name, key, build):
+    """Sidecar summary SIDECAR_DIR/name, rebuilt with build() (the summarize() of its data) when missing, of an
+    older SIDECAR_VERSION or built from files in another state than `key`, their [path, mtime, size].
+    """
+    sidecar = os.path.join(SIDECAR_DIR, name)
+    try:
+        with open(sidecar, 'r') as f:
+            summary = json.load(f)
+        if summary.get('version', 1) == SIDECAR_VERSION and summary.get('key') == key:
+            return summary
+    except (OSError, ValueError):
+        pass
+
+    summary = {'version': SIDECAR_VERSION, 'key': key, 'days': build()}
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        with open(sidecar + '.tmp', 'w') as f:
+            json.dump(summary, f, separators=(',', ':'))
+        os.replace(sidecar + '.tmp', sidecar)
+    except OSError as e:
+        print("Could not write sidecar:", e)
+    return summary
+
+def file_state(path):
+    """[path, mtime, size] of a file, what its sidecar is checked against."""
+    info = os.stat(path)
+    return [path, info.st_mtime, info.st_size]
+
+def hpc_summary(path):
+    """Sidecar summary of one daily HPC file, cleaned with its day_context(), which it is checked against too."""
+    context = day_context(path)
+    def build():
+        timestamps, data = read_hpc_file(path)
+        columns = list(data)
+        cleaned = clean_day(context, columns, np.array([data[column] for column in columns]).T.reshape(len(timestamps), len(columns)))
+        return summarize(timestamps, {column: cleaned[:, i] for i, column in enumerate(columns)})
+    return load_sidecar(os.path.basename(path) + '.json', [file_state(path), context_digest(context)], build)
+
+def export_summary(source):
+    """Sidecar summary of the ENT or UPS trendlog: its exports merged into one series by merge_exports(), so
+    where they overlap every moment is counted once, from the export that starts later, like the raw rows.
+    Rebuilt whenever any export changes.
+    """
+    files = export_files(source)
+    row_reader, line_timestamp, key = export_readers[source]
+    def build():
+        timestamps, power = merge_exports(files, [(-np.inf, np.inf)], row_reader, line_timestamp)
+        return summarize(timestamps, {key: clean_series(power)})
+    return load_sidecar(f'{source}.json', [file_state(file) for file in files], build)
+
+def needs_samples():
+    """Whether the output is drawn from every cleaned sample of the group rather than per-bucket statistics."""
+    return args.fullRes or args.htmlOut or args.heatmapOut or args.energy or args.compare
+
+def plan_query(width):
+    """Splits the requested period into whole local days to answer from sidecars and the (start, end)
+    ranges at the edges that still need raw rows. Only day-sized buckets can use sidecars, and
+    needs_samples() modes and percentiles of combined groups need every sample.
+    Returns ({date: midnight}, ranges).
+    """
+    start, end = startDate.timestamp(), endDate.timestamp()
+    if width % 86400 or args.noSidecars or needs_samples() or (args.percentiles and combined_group()):
+        return {}, [(start, end)]
+    midnights = local_midnights(start, end)
+    midnights = midnights[(midnights >= start) & (midnights <= end)]
+    if len(midnights) < 2: # no day falls entirely inside the period
+        return {}, [(start, end)]
+    days = {datetime.fromtimestamp(t).date().isoformat(): int(t) for t in midnights[:-1]}
+    ranges = []
+    if start < midnights[0]:
+        ranges.append((start, midnights[0] - 1))
+    if midnights[-1] < end:
+        ranges.append((midnights[-1], end))
+    return days, ranges
+
+def load_sidecar_stats(days, edges, sources):
+    """Fills sidecar_stats with the per-bucket statistics of the given whole days for each source.
+    Daily HPC files are added up; ENT/UPS days come from the summary of their merged exports.
+    """
+    first, last = min(days.values()), max(days.values())
+    for source in sources:
+        perDay = {}
+        if source == 'HPC':
+            keys = hpc_columns()
+            for file in hpc_files(first - 86400, last + 86400):
+                for date, day in hpc_summary(file)['days'].items():
+                    if date not in days:
                         continue
-                    ups_data['Date'].append(timestamp)
-                    ups_data['UPS_AVG'].append(int(row['Watts Out (avg)']) / 1000.0)
-                latestTime = timestamp
+                    if date in perDay:
+                        kept = perDay[date]
+                        names = set(kept['columns']) | set(day['columns'])
+                        day = {'rows': kept['rows'] + day['rows'],
+                               'columns': {name: merge_summaries(kept['columns'].get(name), day['columns'].get(name)) for name in names}}
+                    perDay[date] = day
+        else:
+            keys = [export_readers[source][2]]
+            perDay = {date: day for date, day in export_summary(source)['days'].items() if date in days}
+
+        n = len(edges) - 1
+        bucket = {date: np.searchsorted(edges, start, side='right') - 1 for date, start in days.items()}
+        stats = {}
+        for key in keys + ['Date']:
+            count, total = np.zeros(n, dtype=np.int64), np.zeros(n)
+            maxs, mins = np.full(n, np.nan), np.full(n, np.nan)
+            for date, day in perDay.items():
+                b = bucket[date]
+                column = {'count': day['rows'], 'sum': 0.0, 'max': np.nan, 'min': np.nan} if key == 'Date' else day['columns'].get(key)
+                if column is None:
+                    continue
+                count[b] += column['count']
+                total[b] += column['sum']
+                maxs[b] = np.fmax(maxs[b], column['max'])
+                mins[b] = np.fmin(mins[b], column['min'])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(count > 0, total / count, np.nan)
+            stats[key] = {'count': count, 'sum': total, 'mean': mean, 'max': maxs, 'min': mins}
+            if key != 'Date': # the day histograms make up a quantile sketch of the buckets
+                stored = [(bucket[date], day['columns'][key]) for date, day in perDay.items() if key in day['columns']]
+                stats[key]['sketch'] = sketch_of(np.array([b for b, column in stored for _ in column['bins']], dtype=np.int64),
+                                                 np.array([i for _, column in stored for i in column['bins']], dtype=np.int64),
+                                                 np.array([c for _, column in stored for c in column['counts']], dtype=np.int64))
+        sidecar_stats[source] = stats
+        print(f"{source}: {len(perDay)} of {len(days)} whole days answered from sidecars")
+
+# RANGE INDEXES ========================================================
+# Every daily HPC file can also get a range index in SIDECAR_DIR (.npz) of the columns queries asked for:
+# the cleaned samples with prefix sums of their values and counts, and the maxima/minima of every
+# INDEX_BLOCK samples. Any bucket's count/sum is then two lookups and its max/min a sparse-table lookup
+# over whole blocks plus fewer than 2 * INDEX_BLOCK samples at the ends, so the work grows with the
+# number of buckets rather than the number of samples.
+def column_index(values):
+    """Range index of one column's cleaned samples: {'values', 'sum', 'count', 'max', 'min'}."""
+    valid = ~np.isnan(values)
+    blocks = np.append(values, np.full(-len(values) % INDEX_BLOCK, np.nan)).reshape(-1, INDEX_BLOCK)
+    return {'values': values, 'sum': np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0)))),
+            'count': np.concatenate(([0], np.cumsum(valid))), 'max': np.fmax.reduce(blocks, axis=1), 'min': np.fmin.reduce(blocks, axis=1)}
+
+def load_index(path, columns):
+    """Range indexes of the given columns of one daily HPC file as {'times': sorted timestamps, column: column_index()},
+    rebuilt when the file or its day_context() changed and extended when a column is missing from it. Columns
+    the file does not have are indexed as NaN, like parse_HPC() reads them.
+    """
+    indexFile = os.path.join(SIDECAR_DIR, os.path.basename(path) + '.npz')
+    info = os.stat(path)
+    context = day_context(path)
+    digest = context_digest(context)
+    stored = {}
+    try:
+        with np.load(indexFile) as npz:
+            if npz['mtime'] == info.st_mtime and npz['size'] == info.st_size and npz['context'] == digest:
+                stored = dict(npz)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if not stored or any(f'{column}|values' not in stored for column in columns):
+        timestamps, data = read_hpc_file(path)
+        order = np.argsort(timestamps, kind='stable')
+        stored.update({'mtime': info.st_mtime, 'size': info.st_size, 'context': digest, 'times': timestamps[order]})
+        raw = np.array([data[column] if column in data else np.full(len(timestamps), np.nan) for column in columns]).T
+        cleaned = clean_day(context, columns, raw.reshape(len(timestamps), len(columns))) # in file order, as parse_HPC() cleans
+        for i, column in enumerate(columns):
+            stored.update({f'{column}|{key}': array for key, array in column_index(cleaned[order, i]).items()})
+        try:
+            os.makedirs(SIDECAR_DIR, exist_ok=True)
+            with open(indexFile + '.tmp', 'wb') as f:
+                np.savez(f, **stored)
+            os.replace(indexFile + '.tmp', indexFile)
+        except OSError as e:
+            print("Could not write range index:", e)
+
+    index = {'times': stored['times']}
+    for column in columns:
+        index[column] = {key: stored[f'{column}|{key}'] for key in ('values', 'sum', 'count', 'max', 'min')}
+    return index
+
+def sparse_table(blocks, reduce):
+    """table[k, i] = reduce of blocks[i : i + 2**k], NaN past the end."""
+    table = [blocks]
+    while 2 ** len(table) <= len(blocks):
+        half = 2 ** (len(table) - 1)
+        table.append(reduce(table[-1][:-half], table[-1][half:]))
+    return np.array([np.append(level, np.full(len(blocks) - len(level), np.nan)) for level in table]).reshape(-1, len(blocks))
+
+def range_reduce(values, blocks, lo, hi, reduce):
+    """reduce (np.fmax or np.fmin) of values[lo:hi] for every pair of lo/hi, NaN for empty ranges.
+    Whole blocks come from a sparse table over the block results, the ragged ends from the values.
+    """
+    result = np.full(len(lo), np.nan)
+    first = -(-lo // INDEX_BLOCK) # first whole block
+    last = hi // INDEX_BLOCK # one past the last whole block
+    whole = last > first
+    if np.any(whole):
+        table = sparse_table(blocks, reduce)
+        k = np.log2(last[whole] - first[whole]).astype(np.int64)
+        result[whole] = reduce(table[k, first[whole]], table[k, last[whole] - (1 << k)])
+    starts = np.concatenate((lo, np.where(whole, last * INDEX_BLOCK, hi)))
+    ends = np.concatenate((np.where(whole, first * INDEX_BLOCK, hi), hi))
+    lengths = np.maximum(ends - starts, 0)
+    positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    reduce.at(result, np.repeat(np.tile(np.arange(len(lo)), 2), lengths), values[positions])
+    return result
+
+def range_stats(index, lo, hi):
+    """bucket_stats() of the samples lo:hi of each bucket, from one column_index()."""
+    count = index['count'][hi] - index['count'][lo]
+    total = index['sum'][hi] - index['sum'][lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return {'count': count, 'sum': total, 'mean': mean,
+            'max': range_reduce(index['values'], index['max'], lo, hi, np.fmax),
+            'min': range_reduce(index['values'], index['min'], lo, hi, np.fmin)}
+
+def load_index_stats(edges, ranges):
+    """Adds the per-bucket statistics of the HPC rows in ranges to sidecar_stats, answered from the range indexes."""
+    columns = hpc_columns()
+    stats = {key: bucket_stats(np.empty(0), np.empty(0), edges) for key in columns + ['Date']}
+    for start, end in ranges:
+        for path in hpc_files(start, end):
+            index = load_index(path, columns)
+            lo = np.searchsorted(index['times'], np.maximum(edges[:-1], np.ceil(start)))
+            hi = np.maximum(np.searchsorted(index['times'], np.minimum(edges[1:], np.floor(end) + 1)), lo)
+            for column in columns:
+                stats[column] = merge_stats(stats[column], range_stats(index[column], lo, hi))
+            stats['Date']['count'] = stats['Date']['count'] + (hi - lo)
+    stored = sidecar_stats.get('HPC', {})
+    sidecar_stats['HPC'] = {key: merge_stats(stored[key], value) if key in stored else value for key, value in stats.items()}
+    print("HPC: answered from range indexes for", [(datetime.fromtimestamp(a), datetime.fromtimestamp(b)) for a, b in ranges])
+
+def use_index():
+    """Whether the HPC rows outside the sidecar days can come from the range indexes. Groups that need
+    ENT/UPS rows aligned to the HPC samples, and modes that need every sample, read raw rows.
+    """
+    if args.noSidecars or needs_samples() or args.percentiles:
+        return False
+    return args.group != 'Com Center Main Room' or hpcOnly
 
 # CLEANING DATA + ALIGNING TIMESTAMPS ==========================================================================
 # if args.group == 'Com Center Main Room':
     # assert hpc_data and ent_data and ups_data
-def clean_data(dataset):
-    for key in dataset: # loop to remove outliers
-        if key != 'Date' and len(dataset[key]) != 0:
-            std = np.std(dataset[key])
-            mean = np.mean(dataset[key])
-            dataset[key] = [0 if abs(val - mean) > (std) else val for val in dataset[key]]
-            for i, val in enumerate(dataset[key]):
-                if val == 0:
-                    next = i
-                    while next != (len(dataset[key]) - 1) and dataset[key][next] == 0: 
-                        next += 1 # finding next valid data point
-                    if i == 0: dataset[key][i] = dataset[key][next] # edge case for first point
-                    elif i == len(dataset[key]) - 1: dataset[key][i] = dataset[key][i - 1] # edge case for last point
-                    else: dataset[key][i] = (dataset[key][i - 1] + dataset[key][next]) / 2
-    return
+class HampelFilter:
+    """Rolling median/MAD (Hampel) outlier filter that can be fed a series chunk by chunk.
+    A sample is an outlier when it sits more than `sigmas` scaled MADs (floored at CLEAN_MIN_SCALE kW,
+    so flat stretches keep small changes) from the median of the `window` samples centered on it,
+    and is replaced by that median. Output lags input by half a window, so call flush() once the
+    stream ends. Feeding a series in one call or in any number of chunks gives identical output,
+    and the threshold only depends on nearby samples, so overlapping queries clean shared data
+    the same way.
+    Works along axis 0, so a (time x column) array cleans every column at once.
+    """
+    def __init__(self, window=CLEAN_WINDOW, sigmas=CLEAN_SIGMAS):
+        self.half = window // 2
+        self.sigmas = sigmas
+        self.head = None # samples held back until there are enough to mirror the start of the stream
+        self.tail = None # last 2*half samples seen: half already emitted (context) + half pending
+        self.outliers = 0 # number of samples replaced so far
+
+    def process(self, chunk):
+        """Feeds the next chunk of samples, returns the cleaned samples that are now final."""
+        chunk = np.asarray(chunk, dtype=float)
+        if self.tail is None:
+            self.head = chunk if self.head is None else np.concatenate((self.head, chunk))
+            if len(self.head) <= self.half:
+                return chunk[:0]
+            chunk, self.head = self.head, None
+            self.tail = chunk[self.half:0:-1] # mirror the start of the stream
+        buffer = np.concatenate((self.tail, chunk))
+        self.tail = buffer[max(len(buffer) - 2 * self.half, 0):]
+        return self._filter(buffer)
+
+    def preview(self):
+        """Returns what flush() would, without ending the stream."""
+        head, tail, outliers = self.head, self.tail, self.outliers
+        pending = self.flush()
+        self.head, self.tail, self.outliers = head, tail, outliers
+        return pending
+
+    def flush(self):
+        """Returns the pending samples, mirroring the end of the stream."""
+        if self.tail is None: # too few samples to judge, pass them through
+            head, self.head = self.head, None
+            return np.empty(0) if head is None else head
+        buffer = np.concatenate((self.tail, self.tail[-2:-self.half - 2:-1]))
+        self.tail = None
+        return self._filter(buffer)
+
+    def _filter(self, buffer):
+        if len(buffer) < 2 * self.half + 1:
+            return buffer[:0]
+        center = buffer[self.half:len(buffer) - self.half]
+        median, outliers = hampel_rule(sliding_window_view(buffer, 2 * self.half + 1, axis=0), center, self.sigmas)
+        self.outliers += int(np.count_nonzero(outliers))
+        return np.where(outliers, median, center)
+
+def clean_series(values):
+    """Runs a whole series through a fresh HampelFilter, returns the cleaned numpy array."""
+    hampel = HampelFilter()
+    return np.concatenate((hampel.process(values), hampel.flush()))
+
+# Every source is cleaned as one continuous stream: the daily HPC files one after the other and the merged
+# ENT/UPS exports. A sample only depends on the half window around it, so a day or a range is cleaned with
+# the rows just past its ends, and sidecars, range indexes and raw reads of any period agree on it.
+def edge_rows(path, count, last=False):
+    """(header, rows) of the first, or with last the last, count complete rows of a daily HPC file as csv rows,
+    read from that end of the file only. A missing file has neither.
+    """
+    if not os.path.exists(path):
+        return [], []
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode(errors='replace')]), [])
+        if not last:
+            rows = []
+            for row in csv.reader(line.decode(errors='replace') for line in f):
+                if len(row) == len(header):
+                    rows.append(row)
+                    if len(rows) == count:
+                        break
+            return header, rows
+        dataStart = f.tell()
+        position = f.seek(0, os.SEEK_END)
+        data = b''
+        while position > dataStart and data.count(b'\n') <= count + 1:
+            step = min(SEEK_BLOCK, position - dataStart)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.split(b'\n')[1 if position > dataStart else 0:] # the first line may start mid-row
+    rows = [row for row in csv.reader(line.decode(errors='replace') for line in lines) if len(row) == len(header)]
+    return header, rows[-count:]
+
+def day_context(path):
+    """Rows a daily HPC file is cleaned with past its own: the last half cleaning window of rows of the file of
+    the day before and the first half window of the day after, as (before, after) edge_rows(). A missing day
+    adds nothing, so the stream is mirrored there as at its ends.
+    """
+    day = datetime.strptime(os.path.basename(path)[:10], '%Y-%m-%d').date()
+    neighbour = lambda days: os.path.join(os.path.dirname(path), (day + timedelta(days=days)).isoformat() + '.csv')
+    return edge_rows(neighbour(-1), CLEAN_WINDOW // 2, last=True), edge_rows(neighbour(1), CLEAN_WINDOW // 2)
+
+def context_digest(context):
+    """Short fingerprint of a day_context(), so what was cleaned with it is rebuilt when a neighbouring day changes."""
+    return hashlib.sha1(json.dumps(context).encode()).hexdigest()
+
+def clean_day(context, columns, values):
+    """Cleans the rows of one daily HPC file, values (rows x columns) in file order, between the day_context() rows."""
+    before, after = [np.array([[float(row[header.index(column)] or 'nan') if column in header else np.nan for column in columns]
+                               for row in rows], dtype=float).reshape(-1, len(columns)) for header, rows in context]
+    cleaned = clean_series(np.concatenate((before, values, after)))
+    return cleaned[len(before):len(before) + len(values)]
+
+def read_trendlog(source, files, ranges):
+    """(timestamps, cleaned values) of the merged ENT or UPS exports inside ranges. EXPORT_CONTEXT seconds of rows
+    past each range are cleaned along and dropped, so the ranges come out as they do in the whole series.
+    """
+    row_reader, line_timestamp, _ = export_readers[source]
+    wider = merge_ranges([(start - EXPORT_CONTEXT, end + EXPORT_CONTEXT) for start, end in ranges])
+    timestamps, power = merge_exports(files, wider, row_reader, line_timestamp)
+    power = clean_series(power)
+    keep = np.zeros(len(timestamps), dtype=bool)
+    for start, end in ranges:
+        keep |= (timestamps >= start) & (timestamps <= end)
+    return timestamps[keep], power[keep]
 
 def align_timestamps(dataset1, dataset2):
     """
@@ -347,7 +1097,7 @@ def align_timestamps(dataset1, dataset2):
     aligned_data = {key: [] for key in dataset1 if key != 'Date'}
 
     idx1 = 0
-    diff_tolerance = 5
+    diff_tolerance = ALIGN_TOLERANCE
 
     for i, ts2 in enumerate(timestamps2):
         if idx1 < len(timestamps1):
@@ -393,260 +1143,1466 @@ def align_timestamps(dataset1, dataset2):
     return
 
 def align():
-    if ups_data:
+    if not hpc_data['Date']: # every day came from the sidecars
+        return
+    if ups_data and ups_data['Date']:
         print(ups_data.keys())
         if upsOnly: print("UPS only requested")
         print("Aligning UPS and HPC data")
         align_timestamps(hpc_data, ups_data)
 
-    if ent_data:
+    if ent_data and ent_data['Date']:
         print(ent_data.keys())
         if entOnly: print("ENT only requested")
         print("Aligning ENT and HPC data")
         align_timestamps(hpc_data, ent_data)
 
-    if ups_data and hpc_data:
+    if ups_data and ups_data['Date']:
         assert(hpc_data['Date'] == ups_data['Date'])
-    if ent_data and hpc_data:
+    if ent_data and ent_data['Date']:
         assert(hpc_data['Date'] == ent_data['Date'])
-    print(np.average(np.diff(hpc_data['Date'])))
+    if len(hpc_data['Date']) > 1:
+        print(np.average(np.diff(hpc_data['Date'])))
+
+# LOADING SOURCES ======================================================
+# HPC, ENT and UPS come from independent files, so the Main Room parses and cleans them at the same time.
+loading = threading.local() # disclaimers of the source load_source() is loading in this thread
+
+def load_source(source, ranges):
+    """Parses and cleans one source. Returns its data, the disclaimers it added and the coverage cache
+    and schema registry entries it recorded, which a worker process cannot save itself without
+    overwriting those of the others.
+    """
+    loading.disclaimers = []
+    parse, data = {'HPC': (parse_HPC, hpc_data), 'ENT': (parse_ENT, ent_data), 'UPS': (parse_UPS, ups_data)}[source]
+    try:
+        parse(ranges) # which cleans the rows too
+        added = loading.disclaimers
+    finally:
+        del loading.disclaimers
+    caches = [{key: entry for key, entry in (cache or {}).items() if entry.get('new')} for cache in (coverage_cache, hpc_schemas)]
+    return data, added, caches
+
+def load_sources(sources, ranges):
+    """Runs load_source() for every source at once and fills hpc_data, ent_data and ups_data.
+    Parsing is CPU-bound Python, so each source gets a forked worker process; where fork is not
+    available they share threads instead, which still overlaps their reads. Disclaimers and cache
+    entries come back from every source and are added and saved here, once.
+    """
+    added = {}
+    if len(sources) == 1:
+        _, added[sources[0]], _ = load_source(sources[0], ranges)
+    else:
+        try:
+            pool = concurrent.futures.ProcessPoolExecutor(len(sources), mp_context=multiprocessing.get_context('fork'))
+        except (ValueError, OSError, NotImplementedError):
+            pool = concurrent.futures.ThreadPoolExecutor(len(sources))
+        threaded = isinstance(pool, concurrent.futures.ThreadPoolExecutor)
+        with pool:
+            futures = {pool.submit(load_source, source, ranges): source for source in sources}
+            for future in concurrent.futures.as_completed(futures):
+                data, added[futures[future]], caches = future.result()
+                print(f"{futures[future]} LOADED")
+                if not threaded: # a worker process filled its own copy of the globals
+                    target = {'HPC': hpc_data, 'ENT': ent_data, 'UPS': ups_data}[futures[future]]
+                    target.clear()
+                    target.update(data)
+                    load_coverage_cache().update(caches[0])
+                    load_hpc_schemas().update(caches[1])
+    for source in sources: # in the order the sources were asked for, like a sequential load
+        disclaimers.extend(added[source])
+    save_coverage_cache()
+    save_hpc_schemas()
+
+# CHUNKED EXECUTION ====================================================
+# --max-memory streams the HPC rows through read -> clean -> align -> aggregate a chunk at a time instead
+# of holding the whole period as lists. Each daily file is cleaned with its day_context(), the alignment
+# carries its state from one chunk to the next, and every chunk is reduced into per-bucket totals in sidecar_stats (the same kind of
+# totals the sidecars provide), so the chart matches an unchunked run. The ENT/UPS trendlogs are sampled
+# more slowly than HPC polling and are kept whole, as arrays.
+def peak_rss():
+    """Peak resident set size of the process so far, in MB."""
+    import resource # POSIX only, and only --max-memory needs it
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, kB on Linux
+
+class ExportAligner:
+    """align_timestamps() of a whole export onto HPC timestamps that arrive in chunks, for the usual case
+    where the export has fewer samples, so it is the one looked up at every HPC timestamp.
+    """
+    def __init__(self, dataset):
+        self.times = np.asarray(dataset['Date'], dtype=np.int64)
+        self.values = {key: np.asarray(values, dtype=float) for key, values in dataset.items() if key != 'Date'}
+        self.idx = 0 # next export sample waiting for a matching HPC timestamp
+
+    def align(self, timestamps):
+        """{key: values} of the export at each of timestamps, continuing from the previous call."""
+        n = len(self.times)
+        lo = np.empty(len(timestamps), dtype=np.int64) # each value is the mean of the samples lo and hi
+        hi = np.empty(len(timestamps), dtype=np.int64)
+        for k, ts2 in enumerate(timestamps):
+            if self.idx >= n: # ran out of values, pad with the last one
+                lo[k] = hi[k] = n - 1
+                continue
+            ts1 = self.times[self.idx]
+            if abs(ts2 - ts1) < ALIGN_TOLERANCE:
+                lo[k] = hi[k] = self.idx
+                self.idx += 1
+            elif ts2 < ts1 or self.idx == 0: # repeat the first value
+                lo[k] = hi[k] = 0
+            elif self.idx >= n - 1: # no later point, repeat previous
+                lo[k] = hi[k] = self.idx - 1
+            else: # between previous and next
+                lo[k], hi[k] = self.idx - 1, self.idx
+        return {key: (values[lo] + values[hi]) / 2 for key, values in self.values.items()}
+
+def accumulate(source, key, stats):
+    """Merges a chunk's bucket_stats() (and its 'sketch', if any) into sidecar_stats[source][key]."""
+    stored = sidecar_stats.setdefault(source, {}).get(key)
+    if stored is None:
+        sidecar_stats[source][key] = stats
+        return
+    merged = merge_stats(stored, stats)
+    if 'sketch' in stats:
+        merged['sketch'] = merge_sketches(stored['sketch'], stats['sketch']) if 'sketch' in stored else stats['sketch']
+    sidecar_stats[source][key] = merged
+
+def reduce_chunk(times, values, columns, aligners, edges, carry):
+    """Aggregates one chunk of cleaned HPC rows, and the exports aligned onto them, into sidecar_stats.
+    The per-sample group load feeds sidecar_stats['Load']: its sketch for percentiles of combined groups
+    and its energy, integrated on from carry, the last (time, load) sample before the chunk. Returns the
+    last sample of this chunk for the next one.
+    """
+    hpc_data.clear()
+    hpc_data.update({'Date': times, **{column: values[:, i] for i, column in enumerate(columns)}})
+    for source, aligner in aligners.items():
+        data = {'ENT': ent_data, 'UPS': ups_data}[source]
+        data.clear()
+        data.update({'Date': times, **aligner.align(times)})
+    for source, data in (('HPC', hpc_data), ('ENT', ent_data), ('UPS', ups_data)):
+        for key in data:
+            stats = bucket_stats(times, np.zeros(len(times)) if key == 'Date' else data[key], edges)
+            if args.percentiles and key != 'Date':
+                stats['sketch'] = bucket_sketch(times, data[key], edges)
+            accumulate(source, key, stats)
+    if not (args.energy or args.percentiles and combined_group()):
+        return carry
+    load = sidecar_stats.setdefault('Load', {})
+    t, series = group_series()
+    if args.percentiles and combined_group():
+        sketch = bucket_sketch(t, series, edges)
+        load['sketch'] = merge_sketches(load['sketch'], sketch) if 'sketch' in load else sketch
+    if args.energy:
+        keep = ~np.isnan(series)
+        t, series = t[keep], series[keep]
+        if carry is not None:
+            t, series = np.concatenate(([carry[0]], t)), np.concatenate(([carry[1]], series))
+        kwh, uncovered = bucket_energy(t, series, edges)
+        seconds = np.diff(np.clip(edges, startDate.timestamp(), endDate.timestamp()).astype(float))
+        load['kwh'] = load.get('kwh', 0) + kwh
+        load['uncovered'] = load.get('uncovered', seconds) - (seconds - uncovered) # what no chunk covered
+        if len(t):
+            carry = (t[-1], series[-1])
+    return carry
+
+def run_chunked(sources, ranges, edges):
+    """Reads, cleans, aligns and aggregates the raw rows of ranges chunk by chunk within --max-memory,
+    leaving the totals in sidecar_stats where calculate() picks them up. Returns False, having read no
+    HPC rows, when an export has at least as many samples as the HPC rows, since align_timestamps()
+    would then move the HPC rows onto the export's timestamps, which cannot be done a chunk at a time.
+    """
+    exports = [source for source in sources if source != 'HPC']
+    if exports:
+        load_sources(exports, ranges)
+    columns = parsed_columns()
+    files = sorted(set(file for start, end in ranges for file in hpc_files(start, end)))
+
+    def in_ranges(timestamps):
+        keep = np.zeros(len(timestamps), dtype=bool)
+        for start, end in ranges:
+            keep |= (timestamps >= start) & (timestamps <= end)
+        return keep
+
+    if exports: # a first pass that only counts the HPC rows
+        rows = sum(np.count_nonzero(in_ranges(read_hpc_columns(file, [])[0])) for file in files)
+        datasets = {'ENT': ent_data, 'UPS': ups_data}
+        if any(len(datasets[source]['Date']) >= rows for source in exports):
+            print(f"\n--max-memory: an export has at least as many samples as the {rows} HPC rows, reading the whole period at once")
+            return False
+    aligners = {source: ExportAligner({'ENT': ent_data, 'UPS': ups_data}[source]) for source in exports}
+    spare = args.maxMemory - peak_rss()
+    if spare <= 0:
+        sys.exit(f"--max-memory {args.maxMemory:g} MB is less than the {peak_rss():.0f} MB already in use")
+    limit = max(int(spare * 2**20 // (CHUNK_VALUE_BYTES * (len(columns) + 1))), CLEAN_WINDOW)
+    print(f"\nREADING HPC DATA IN CHUNKS OF UP TO {limit} ROWS ({args.maxMemory:g} MB budget)")
+
+    times, values = [], []
+    carry = None
+    chunks = outliers = 0
+    for i, file in enumerate(files):
+        timestamps, table = read_hpc_columns(file, columns)
+        cleaned = clean_day(day_context(file), columns, table)
+        outliers += int(np.count_nonzero((cleaned != table) & ~np.isnan(table)))
+        keep = in_ranges(timestamps)
+        times.append(timestamps[keep])
+        values.append(cleaned[keep])
+        if sum(map(len, times)) < limit and i < len(files) - 1:
+            continue
+        carry = reduce_chunk(np.concatenate(times), np.concatenate(values).reshape(-1, len(columns)), columns, aligners, edges, carry)
+        times, values = [], []
+        chunks += 1
+    save_hpc_schemas()
+    for data in (hpc_data, ent_data, ups_data): # every sample lives in the totals now
+        for key in data:
+            data[key] = []
+    hpc_data[args.group] = []
+    print(f"{chunks} CHUNKS, {outliers} HPC outliers replaced, PEAK RSS {peak_rss():.1f} MB")
+    if peak_rss() > args.maxMemory: # the chunk size is an estimate and a daily file is always read whole
+        print(f"PEAK RSS WAS OVER THE {args.maxMemory:g} MB BUDGET, a lower --max-memory gives smaller chunks")
+    return True
+
+# TIME BUCKETS =========================================================
+def bucket_width(start, end, numPoints):
+    """Smallest wall-clock width (seconds) from BUCKET_WIDTHS that splits [start, end) into at most numPoints buckets.
+    Past a week, widths are whole numbers of days.
+    """
+    for width in BUCKET_WIDTHS:
+        if (end - start) / width <= numPoints:
+            return width
+    return 86400 * int(np.ceil((end - start) / numPoints / 86400))
+
+def bucket_edges(start, end, width):
+    """Edges of the buckets covering [start, end). Buckets of up to a day are counted from the local midnight
+    of their own day, so they fall on the same boundaries no matter which day a query starts and can be
+    cached and reused between overlapping queries. On a day that is 23 or 25 hours long, the last bucket
+    is cut short at midnight when the width does not divide the day.
+    """
+    if width % 86400 == 0: # whole days follow the calendar, so they stay on midnight across DST changes
+        edges = local_midnights(start, end + width)[::width // 86400]
+        return edges[:np.searchsorted(edges, end) + 1]
+    midnights = local_midnights(start, end)
+    edges = np.concatenate([np.arange(day, following, width, dtype=np.int64) for day, following in zip(midnights[:-1], midnights[1:])] + [midnights[-1:]])
+    first = np.searchsorted(edges, start, side='right') - 1
+    return edges[first:np.searchsorted(edges, end) + 1]
+
+def local_midnights(start, end):
+    """Timestamps of local midnight for every day from the one containing start through the day after end."""
+    day = datetime.fromtimestamp(start).date()
+    last = datetime.fromtimestamp(end).date() + timedelta(days=1)
+    midnights = []
+    while day <= last:
+        midnights.append(int(time.mktime(day.timetuple())))
+        day += timedelta(days=1)
+    return np.array(midnights, dtype=np.int64)
+
+def bucket_index(timestamps, edges):
+    """Bucket of each timestamp, found by integer-dividing it by the bucket width. Timestamps outside
+    the edges get an index below 0 or past the last bucket.
+    """
+    width = edges[1] - edges[0]
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if np.all(np.diff(edges) == width):
+        return (timestamps - edges[0]) // width
+    return np.searchsorted(edges, timestamps, side='right') - 1 # calendar days around a DST change are 23 or 25 hours long
+
+def bucket_stats(timestamps, values, edges):
+    """Reduces samples into the buckets given by edges.
+    Returns {'count', 'sum', 'mean', 'max', 'min'} arrays with one entry per bucket. Samples outside the
+    edges and NaNs are ignored; empty buckets have a count of 0 and NaN for everything else.
+    """
+    n = len(edges) - 1
+    values = np.asarray(values, dtype=float)
+    idx = bucket_index(timestamps, edges)
+    keep = (idx >= 0) & (idx < n) & ~np.isnan(values)
+    idx, values = idx[keep], values[keep]
+    if np.any(np.diff(idx) < 0): # reduceat needs the samples grouped by bucket
+        order = np.argsort(idx, kind='stable')
+        idx, values = idx[order], values[order]
+
+    count = np.bincount(idx, minlength=n)
+    total = np.bincount(idx, weights=values, minlength=n)
+    maxs = np.full(n, np.nan)
+    mins = np.full(n, np.nan)
+    if len(idx):
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(idx)) + 1))
+        maxs[idx[starts]] = np.maximum.reduceat(values, starts)
+        mins[idx[starts]] = np.minimum.reduceat(values, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return {'count': count, 'sum': total, 'mean': mean, 'max': maxs, 'min': mins}
+
+def merge_stats(a, b):
+    """Combines two bucket_stats() results over the same buckets."""
+    count = a['count'] + b['count']
+    total = a['sum'] + b['sum']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return {'count': count, 'sum': total, 'mean': mean, 'max': np.fmax(a['max'], b['max']), 'min': np.fmin(a['min'], b['min'])}
+
+def sketch_of(buckets, bins, counts):
+    """Quantile sketch from (bucket, histogram bin, count) triples, adding up repeated pairs.
+    A sketch is {'bucket', 'bin', 'count'} arrays: a sparse histogram over histogram_bins() per bucket,
+    the same log-spaced bins the sidecars store per day. Like DDSketch, sketches merge by adding counts
+    and answer any quantile within about HIST_GAMMA relative error.
+    """
+    keys, inverse = np.unique(buckets * (1 << 20) + bins, return_inverse=True)
+    return {'bucket': keys >> 20, 'bin': keys & ((1 << 20) - 1),
+            'count': np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)}
+
+def bucket_sketch(timestamps, values, edges):
+    """Quantile sketch of samples in the buckets given by edges. NaNs and samples outside the edges are ignored."""
+    values = np.asarray(values, dtype=float)
+    idx = bucket_index(timestamps, edges)
+    keep = (idx >= 0) & (idx < len(edges) - 1) & ~np.isnan(values)
+    return sketch_of(idx[keep], histogram_bins(values[keep]), np.ones(np.count_nonzero(keep), dtype=np.int64))
+
+def merge_sketches(a, b):
+    return sketch_of(*(np.concatenate((a[key], b[key])) for key in ('bucket', 'bin', 'count')))
+
+def sketch_quantile(sketch, q, n):
+    """Per-bucket q-quantile (0 to 1) of a sketch over n buckets, NaN for empty buckets.
+    Each bin stands for bin_value(), so readings within HIST_MIN of zero come back as 0.
+    """
+    bucket, bins, count = sketch['bucket'], sketch['bin'], sketch['count'] # sketch_of() sorts by bucket, then bin
+    totals = np.bincount(bucket, weights=count, minlength=n)
+    earlier = np.cumsum(count) - count - (np.cumsum(totals) - totals)[bucket] # samples before each bin within its bucket
+    rank = (q * (totals - 1))[bucket]
+    hit = (earlier <= rank) & (rank < earlier + count)
+    result = np.full(n, np.nan)
+    result[bucket[hit]] = bin_value(bins[hit])
+    return result
+
+def bucket_label(timestamp):
+    return datetime.fromtimestamp(int(timestamp)).strftime("%m/%d-%H:%M")
 
 # CALCULATING MAX/AVERAGES =============================================
-def calculate(interval):
-    if not args.avg and not args.max: # if neither's specified, turn both on for default behavior
-        args.avg = True
-        args.max = True
+def by_era(bucketStart, march, february, before):
+    """Picks per-bucket values for the annex metering eras: past March 13th, past February 16th, and before."""
+    return np.select([bucketStart >= 1710302406, bucketStart >= 1708059906], [march, february], default=before)
 
+def combine_components(component, times, stat):
+    """Combines the metered components of args.group into its load, one value per entry of times.
+    component(dataset, key) returns the values of one column lined up with times, and stat says
+    whether they are averages ('mean'), maxima ('max') or minima ('min'), since the annex corrections differ.
+    """
     if args.group == 'Com Center Main Room': # MAIN ROOM CALCULATIONS
-        for x in range(0, int(args.numPoints)): 
-            if args.avg: 
-                if ups_data:
-                    upsAvg = round(sum(ups_data['UPS_AVG'][x*interval : (x+1)*interval]) / interval, 2)
-                if ent_data:
-                    entAvg = round(sum(ent_data['Com Center Main Room'][x*interval : (x+1)*interval]) / interval, 2)
-                swUPSAvg = round(sum(hpc_data['SeaWulf Main Room on UPS'][x*interval : (x+1)*interval]) / interval, 2)
-                swNonUPSAvg = round(sum(hpc_data['SeaWulf Main Room on Non-UPS'][x*interval : (x+1)*interval]) / interval, 2)
-                if not (hpcOnly or entOnly or upsOnly):
-                    swAnnexUPSAvg = round(sum(hpc_data['SeaWulf Annex on UPS'][x*interval : (x+1)*interval]) / interval, 2)
-
-                if upsOnly: # display only UPS data
-                    average = upsAvg
-                elif entOnly: # display only Enterprise Equipment data
-                    average = entAvg
-                elif hpcOnly: # display only SeaWulf data
-                    average = swUPSAvg + swNonUPSAvg
-                else: # OBTAINING ANNEX DATA
-                    if (hpc_data['Date'][x*interval] >= 1710302406): # if data's past March 13th
-                        swAnnexUPSAvg = swAnnexUPSAvg + SCGP_LOAD
-                    elif hpc_data['Date'][x*interval] >= 1708059906: # if data's past February 16th
-                        swAnnexUPSAvg = swAnnexUPSAvg + SCGP_LOAD + ANNEX_A03
-                    else:
-                        swAnnexUPSAvg = ANNEX_UPS # relying on precomputed values, might not be accurate
-                    if nonmetered: # for nonmetered equipment
-                        average = upsAvg - entAvg - swUPSAvg - swAnnexUPSAvg
-                    else:  # for regular main room total
-                        average = swNonUPSAvg + upsAvg - swAnnexUPSAvg
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                averages[date] = round(average, 2)
-            if args.max: 
-                if ups_data:
-                    upsMax = round(max(ups_data['UPS_AVG'][x*interval : (x+1)*interval]), 2)
-                if ent_data:
-                    entMax = round(max(ent_data['Com Center Main Room'][x*interval : (x+1)*interval]), 2)
-                swUPSMax = round(max(hpc_data['SeaWulf Main Room on UPS'][x*interval : (x+1)*interval]), 2)
-                swNonUPSMax = round(max(hpc_data['SeaWulf Main Room on Non-UPS'][x*interval : (x+1)*interval]), 2)
-                if not (hpcOnly or entOnly or upsOnly):
-                    swAnnexUPSMax = round(max(hpc_data['SeaWulf Annex on UPS'][x*interval : (x+1)*interval]), 2)
-
-                if upsOnly: # display only UPS data
-                    maximum = upsMax
-                elif entOnly: # display only Enterprise Equipment data
-                    maximum = entMax
-                elif hpcOnly: # display only SeaWulf data
-                    maximum = swUPSMax + swNonUPSMax
-                else:
-                    # OBTAINING ANNEX DATA
-                    if (hpc_data['Date'][x*interval] >= 1710302406): # if data's past March 13th
-                        swAnnexUPSMax = swAnnexUPSMax + SCGP_LOAD
-                    elif hpc_data['Date'][x*interval] >= 1708059906: # if data's past February 16th
-                        swAnnexUPSMax = swAnnexUPSMax + SCGP_LOAD + ANNEX_A03
-                    else:
-                        swAnnexUPSMax = ANNEX_UPS
-                    if nonmetered: # for nonmetered equipment
-                        maximum = upsMax - entMax - swUPSMax - swAnnexUPSMax
-                    else:  # for regular main room total
-                        maximum = swNonUPSMax + upsMax - swAnnexUPSMax
-
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                maxes[date]  = round(maximum, 2)
+        if upsOnly: # display only UPS data
+            return component(ups_data, 'UPS_AVG')
+        if entOnly: # display only Enterprise Equipment data
+            return component(ent_data, 'Com Center Main Room')
+        swUPS = component(hpc_data, 'SeaWulf Main Room on UPS')
+        swNonUPS = component(hpc_data, 'SeaWulf Main Room on Non-UPS')
+        if hpcOnly: # display only SeaWulf data
+            return swUPS + swNonUPS
+        swAnnexUPS = component(hpc_data, 'SeaWulf Annex on UPS') # OBTAINING ANNEX DATA
+        swAnnexUPS = by_era(times, swAnnexUPS + SCGP_LOAD, swAnnexUPS + SCGP_LOAD + ANNEX_A03, ANNEX_UPS) # relying on precomputed values before February, might not be accurate
+        ups = component(ups_data, 'UPS_AVG')
+        if nonmetered: # for nonmetered equipment
+            return ups - component(ent_data, 'Com Center Main Room') - swUPS - swAnnexUPS
+        return swNonUPS + ups - swAnnexUPS # for regular main room total
     elif args.group == 'Com Center Annex Total':
-        for x in range(0, int(args.numPoints)): 
-            if args.avg: 
-                if (hpc_data['Date'][x*interval] >= 1710302406): # if data's past March 13th
-                    annex_load = (sum(hpc_data[args.group][x*interval : (x+1)*interval]) / interval) + ANNEX_NONUPS + SCGP_LOAD
-                elif (hpc_data['Date'][x*interval] >= 1708059906): # if data's past February 16th
-                    annex_load = (sum(hpc_data[args.group][x*interval : (x+1)*interval]) / interval) + ANNEX_A03 + ANNEX_NONUPS + SCGP_LOAD
-                else:
-                    annex_load = ANNEX_UPS
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                averages[date] = round(annex_load, 2)
-            if args.max: # for the -m flag and default behaviosr
-                # print("MAX:" , max(hpc_data[args.group][x*interval : (x+1)*interval]))
-                if(hpc_data['Date'][x*interval] >= 1710302406):  # if data's past March 13th
-                    annex_load = max(hpc_data[args.group][x*interval : (x+1)*interval]) + SCGP_LOAD
-                elif(hpc_data['Date'][x*interval] >= 1708059906):  # if data's past February 16th
-                    annex_load = max(hpc_data[args.group][x*interval : (x+1)*interval]) + SCGP_LOAD + ANNEX_A03
-                else: 
-                    annex_load = ANNEX_UPS
-                # print("MAX CALCULATED:" , annex_load)
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                maxes[date]  = round(annex_load, 2)
+        load = component(hpc_data, args.group)
+        if stat in ('max', 'min'): # bounds of the metered load, without the unmetered non-UPS estimate
+            return by_era(times, load + SCGP_LOAD, load + SCGP_LOAD + ANNEX_A03, ANNEX_UPS)
+        return by_era(times, load + ANNEX_NONUPS + SCGP_LOAD, load + ANNEX_A03 + ANNEX_NONUPS + SCGP_LOAD, ANNEX_UPS)
     elif args.group == 'SeaWulf Annex on UPS':
-        for x in range(0, int(args.numPoints)): 
-            if args.avg: 
-                if (hpc_data['Date'][x*interval] >= 1710302406): # if data's past March 13th
-                    annex_load = (sum(hpc_data[args.group][x*interval : (x+1)*interval]) / interval)
-                elif (hpc_data['Date'][x*interval] >= 1708059906):
-                    annex_load = (sum(hpc_data[args.group][x*interval : (x+1)*interval]) / interval) + ANNEX_A03
-                else:
-                    annex_load = ANNEX_UPS
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                averages[date] = round(annex_load, 2)
-            if args.max: # for the -m flag and default behaviosr
-                if (hpc_data['Date'][x*interval] >= 1710302406): # if data's past March 13th
-                    annex_load = (max(hpc_data[args.group][x*interval : (x+1)*interval]))
-                elif (hpc_data['Date'][x*interval] >= 1708059906):
-                    annex_load = (max(hpc_data[args.group][x*interval : (x+1)*interval])) + ANNEX_A03
-                else: 
-                    annex_load = ANNEX_UPS
-                # print("MAX CALCULATED:" , annex_load)
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                maxes[date]  = round(annex_load, 2)
-    else: # for non main room
-        for x in range(0, int(args.numPoints)):
-            if args.avg: # for the -a flag and default behavior
-                average = round(sum(hpc_data[args.group][x*interval : (x+1)*interval]) / interval, 2)
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                averages[date]  = average
-            if args.max: # for the -m flag and default behavior
-                maxim = round(max(hpc_data[args.group][x*interval : (x+1)*interval]), 2)
-                datetime_obj = datetime.fromtimestamp(round(sum(hpc_data['Date'][x*interval : (x+1)*interval]) / interval))
-                date = datetime_obj.strftime("%m/%d-%H:%M")
-                maxes[date]  = maxim
+        load = component(hpc_data, args.group)
+        return by_era(times, load, load + ANNEX_A03, ANNEX_UPS)
+    return component(hpc_data, args.group) # for non main room
+
+def source_name(dataset):
+    return 'HPC' if dataset is hpc_data else 'ENT' if dataset is ent_data else 'UPS'
+
+def component_stats(dataset, key, edges):
+    """Per-bucket stats of one column: the raw rows that were read plus any whole days from the sidecars."""
+    stats = bucket_stats(dataset['Date'], dataset[key], edges)
+    stored = sidecar_stats.get(source_name(dataset), {}).get(key)
+    return merge_stats(stats, stored) if stored else stats
+
+def group_load(stat, edges):
+    """Per-bucket load for args.group, where stat is a key of bucket_stats() ('mean', 'max' or 'min')."""
+    return combine_components(lambda dataset, key: component_stats(dataset, key, edges)[stat], edges[:-1], stat)
+
+def whole_period(sketch):
+    """Merges every bucket of a sketch into bucket 0."""
+    return sketch_of(np.zeros(len(sketch['bucket']), dtype=np.int64), sketch['bin'], sketch['count'])
+
+def component_quantile(dataset, key, edges, q, whole=False):
+    """Per-bucket q-quantile of one column: a sketch of the raw rows merged with any sidecar days.
+    With whole, a single quantile over all the buckets.
+    """
+    sketch = bucket_sketch(dataset['Date'], dataset[key], edges)
+    stored = sidecar_stats.get(source_name(dataset), {}).get(key)
+    if stored:
+        sketch = merge_sketches(sketch, stored['sketch'])
+    if whole:
+        return sketch_quantile(whole_period(sketch), q, 1)
+    return sketch_quantile(sketch, q, len(edges) - 1)
+
+def percentile_load(p, edges, whole=False):
+    """Per-bucket p-th percentile load for args.group, or a single one over the period with whole.
+    Quantiles do not add up, so groups combining several metered columns are sketched from their
+    per-sample load (group_series()); for the others the percentile of the column is shifted by the
+    same constants as the average (for whole, those of the era the period starts in).
+    """
+    if combined_group():
+        times, load = group_series()
+        sketch = bucket_sketch(times, load, edges)
+        if 'sketch' in sidecar_stats.get('Load', {}): # --max-memory's running sketch
+            sketch = merge_sketches(sketch, sidecar_stats['Load']['sketch'])
+        return sketch_quantile(whole_period(sketch), p / 100, 1) if whole else sketch_quantile(sketch, p / 100, len(edges) - 1)
+    times = edges[:1] if whole else edges[:-1]
+    return combine_components(lambda dataset, key: component_quantile(dataset, key, edges, p / 100, whole), times, 'mean')
+
+def combined_group():
+    """Whether args.group is computed from more than one metered column at the same time."""
+    return args.group == 'Com Center Main Room' and not upsOnly and not entOnly
+
+def group_series():
+    """Per-sample load for args.group as (timestamps, values). Needs align() to have run first,
+    so every source shares the HPC timestamps.
+    """
+    times = np.asarray(hpc_data['Date'], dtype=np.int64)
+    return times, combine_components(lambda dataset, key: np.asarray(dataset[key], dtype=float), times, 'mean')
+
+# DECIMATION ===========================================================
+def m4_indices(timestamps, values, columns):
+    """Indices of the samples to draw so a line over `columns` pixel columns looks the same as with every
+    sample (M4 decimation): the first, last, minimum and maximum sample of each column, in time order.
+    Expects timestamps sorted. NaNs are dropped.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) <= 4 * columns:
+        return valid
+    timestamps, values = timestamps[valid], values[valid]
+    span = max(int(timestamps[-1] - timestamps[0]), 1)
+    column = (timestamps - timestamps[0]) * (columns - 1) // span
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(column)) + 1))
+    ends = np.concatenate((starts[1:], [len(column)])) - 1
+    lows = np.minimum.reduceat(values, starts)
+    highs = np.maximum.reduceat(values, starts)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.concatenate((starts, [len(column)]))))
+    firstLow = np.unique(group[values == lows[group]], return_index=True)[1] # first sample equal to its column's min
+    firstHigh = np.unique(group[values == highs[group]], return_index=True)[1]
+    isLow = np.flatnonzero(values == lows[group])[firstLow]
+    isHigh = np.flatnonzero(values == highs[group])[firstHigh]
+    return valid[np.unique(np.concatenate((starts, ends, isLow, isHigh)))]
+
+# ENERGY ===============================================================
+def bucket_energy(times, load, edges):
+    """Energy (kWh) of a load series in each bucket by the trapezoidal rule over the real sample times,
+    and the seconds of each bucket it does not cover. Intervals longer than ENERGY_GAP, or next to a
+    NaN, are not interpolated across and count as uncovered, as does time before the first or after
+    the last sample. Buckets are cut at the requested period.
+    """
+    keep = ~np.isnan(load)
+    times, load = np.asarray(times, dtype=float)[keep], load[keep]
+    bounds = np.clip(edges, startDate.timestamp(), endDate.timestamp()).astype(float)
+    if len(times) < 2:
+        return np.zeros(len(edges) - 1), np.diff(bounds)
+    seconds = np.diff(times)
+    spanned = np.where(seconds <= ENERGY_GAP, seconds, 0)
+    energy = np.concatenate(([0], np.cumsum((load[:-1] + load[1:]) / 2 * spanned / 3600))) # cumulative kWh at each sample
+    covered = np.concatenate(([0], np.cumsum(spanned)))
+    kwh = np.diff(np.interp(bounds, times, energy))
+    return kwh, np.diff(bounds) - np.diff(np.interp(bounds, times, covered))
+
+# PERIOD COMPARISON ====================================================
+# --compare loads the requested period and every earlier one in a single read, then buckets each earlier
+# period's samples on its own edges: the requested edges moved back a whole number of local days, so the
+# i-th bucket of every period starts at the same wall-clock time and they share the chart's time axis.
+def offset_days(offset, date):
+    """Days between date and the same date OFFSET earlier. Months and years are counted on the calendar,
+    a day that the earlier month does not have (e.g. the 31st) falls back to its last day.
+    """
+    n, unit = int(offset[:-1]), offset[-1]
+    if unit in 'dw':
+        return n * (7 if unit == 'w' else 1)
+    months = date.year * 12 + date.month - 1 - (n * 12 if unit == 'y' else n)
+    year, month = divmod(months, 12)
+    day = date.day
+    while True:
+        try:
+            return (date.date() - date.date().replace(year=year, month=month + 1, day=day)).days
+        except ValueError: # e.g. February 30th
+            day -= 1
+
+def shift_edges(edges, days):
+    """edges moved back days local calendar days, keeping their wall-clock time across DST changes."""
+    return np.array([int((datetime.fromtimestamp(int(t)) - timedelta(days=days)).timestamp()) for t in edges], dtype=np.int64)
+
+def compare_ranges():
+    """(start, end) timestamps of the earlier periods of every --compare OFFSET."""
+    ranges = []
+    for offset in args.compare or []:
+        days = offset_days(offset, startDate)
+        ranges.append(((startDate - timedelta(days=days)).timestamp(), (endDate - timedelta(days=days)).timestamp()))
+    return ranges
+
+def period_stats(edges):
+    """Per-bucket average and max load of the group over edges, computed like the chart's lines
+    (group_load()), and their average and max over the whole period like its Cumulative figures,
+    NaN without samples.
+    """
+    stats = {'mean': group_load('mean', edges), 'max': group_load('max', edges)}
+    if np.all(np.isnan(stats['mean'])):
+        return stats, {'mean': np.nan, 'max': np.nan}
+    return stats, {'mean': np.nanmean(stats['mean']), 'max': np.nanmax(stats['max'])}
+
+def compare_periods(edges):
+    """Fills comparisons with the per-bucket average and max load of every --compare period, lined up
+    with the requested buckets, and a summary of how the requested period differs from it. Both periods
+    go through group_load(), so the overlays, deltas and summary measure what the chart's lines do.
+    """
+    current, now = period_stats(edges)
+    starts = list(counts.keys())
+    for offset in args.compare:
+        days = offset_days(offset, startDate)
+        earlier, then = period_stats(shift_edges(edges, days))
+        if np.all(np.isnan(earlier['mean'])):
+            disclaimers.append(f"No data for the period {offset} earlier.")
+        summary = f'vs {offset} earlier:'
+        for stat, name in (('mean', 'average'), ('max', 'max')):
+            delta = now[stat] - then[stat]
+            summary += f'   {name} {"--" if np.isnan(delta) else f"{delta:+.3f} kW"}'
+            if then[stat] and not np.isnan(delta):
+                summary += f' ({delta / then[stat]:+.1%})'
+        difference = current['mean'] - earlier['mean']
+        if not np.all(np.isnan(difference)):
+            i = int(np.nanargmax(np.abs(difference)))
+            summary += f'   largest difference {difference[i]:+.3f} kW at {bucket_label(starts[i])}'
+        comparisons[offset] = {'start': startDate - timedelta(days=days), 'end': endDate - timedelta(days=days),
+                               'mean': {start: round(float(value), 2) for start, value in zip(starts, earlier['mean'])},
+                               'max': {start: round(float(value), 2) for start, value in zip(starts, earlier['max'])},
+                               'summary': summary}
+        print(summary)
+
+def group_energy(edges):
+    """bucket_energy() of the group's load, or the totals --max-memory integrated chunk by chunk."""
+    if 'kwh' in sidecar_stats.get('Load', {}):
+        return sidecar_stats['Load']['kwh'], sidecar_stats['Load']['uncovered']
+    return bucket_energy(*group_series(), edges)
+
+def calculate(edges):
+    if not args.avg and not args.max and not args.percentiles and not args.energy: # if neither's specified, turn both on for default behavior
+        args.avg = True
+        args.max = True
+
+    starts = edges[:-1].tolist() # buckets are keyed by their start, labels repeat on DST fall-back nights and across years
+    if args.avg: # for the -a flag and default behavior
+        for start, value in zip(starts, group_load('mean', edges)):
+            averages[start] = round(float(value), 2)
+    if args.max: # for the -m flag and default behavior
+        for start, value in zip(starts, group_load('max', edges)):
+            maxes[start] = round(float(value), 2)
+    for p in args.percentiles or []: # for --percentile
+        percentiles[p] = {start: round(float(value), 2) for start, value in zip(starts, percentile_load(p, edges))}
+    if args.energy: # for --energy
+        kwh, uncovered = group_energy(edges)
+        for start, value in zip(starts, kwh):
+            energies[start] = round(float(value), 3)
+        if uncovered.sum() >= 1:
+            disclaimers.append(f"{uncovered.sum() / 3600:.1f} h of the period have no samples less than {ENERGY_GAP // 60} min apart and are left out of the energy.")
 
+    # sample counts come from the HPC timestamps, which every other source is aligned to
+    rows = bucket_stats(hpc_data['Date'], np.zeros(len(hpc_data['Date'])), edges)['count']
+    if 'Date' in sidecar_stats.get('HPC', {}):
+        rows = rows + sidecar_stats['HPC']['Date']['count']
+    for start, count in zip(starts, rows):
+        counts[start] = int(count)
+    empty = [bucket_label(start) for start in starts if counts[start] == 0]
+    print(f"\nBUCKETS: {len(starts)} x {(edges[1] - edges[0]) / 60:g} min, samples per bucket {min(counts.values())}-{max(counts.values())}")
+    if empty:
+        print("EMPTY BUCKETS:", empty)
+        disclaimers.append(f"No data for {len(empty)} of {len(starts)} time buckets (gaps in polling).")
+    if args.compare: # for --compare
+        compare_periods(edges)
+
+def chart_data(edges):
+    """Everything draw_chart() needs, taken from what calculate() filled in, as plain values that can
+    be handed to another thread or process.
+    """
     totAvg = '--' # calculating cumulative values
     totMax = '--'
-    if averages:
-        totAvg = round(sum(averages.values()) / len(averages), 3)
-    if maxes:
-        totMax = round(max(maxes.values()), 3)
+    if averages and not np.all(np.isnan(list(averages.values()))):
+        totAvg = round(float(np.nanmean(list(averages.values()))), 3)
+    if maxes and not np.all(np.isnan(list(maxes.values()))):
+        totMax = round(float(np.nanmax(list(maxes.values()))), 3)
     stats = f'Cumulative Average: {totAvg} kW   Cumulative Max: {totMax} kW'
-    period = f'Data from {startDate} to {endDate}'
+    for p in percentiles: # over the whole period, not the average of the buckets
+        total = percentile_load(p, edges, whole=True)[0]
+        stats += f'   p{p:g}: {"--" if np.isnan(total) else round(float(total), 3)} kW'
+    if energies:
+        stats += f'   Total Energy: {round(sum(energies.values()), 1)} kWh'
+
+    lines = [] # (timestamps, y, label, line style, whether every point gets its value written next to it)
+    if args.fullRes: # every sample, decimated to what the figure can show
+        times, load = group_series()
+        keep = m4_indices(times, load, int(CHART_SIZE[0] * CHART_DPI))
+        lines.append((times[keep], load[keep], 'load', {'linewidth': 0.8}, False))
+    else:
+        middles = dict(zip(edges[:-1].tolist(), ((edges[:-1] + edges[1:]) // 2).tolist())) # every bucket at its middle
+        def series(values): # x and y of a {bucket start: value} dict, so each point stays with its own bucket
+            return np.array([middles[start] for start in values], dtype=np.int64), list(values.values())
+        if averages:
+            lines.append((*series(averages), 'average', {}, not args.plotClean))
+        if maxes:
+            lines.append((*series(maxes), 'maximum', {}, not args.plotClean))
+        for p, values in percentiles.items():
+            lines.append((*series(values), f'p{p:g}', {'linestyle': '--'}, not args.plotClean))
+        for offset, earlier in comparisons.items(): # faded, without values, so the requested period stays readable
+            span = f"{earlier['start']:%m/%d/%Y}-{earlier['end']:%m/%d/%Y}"
+            if averages:
+                lines.append((*series(earlier['mean']), f'average {offset} earlier ({span})', {'linestyle': ':', 'alpha': 0.7}, False))
+            if maxes:
+                lines.append((*series(earlier['max']), f'maximum {offset} earlier ({span})', {'linestyle': ':', 'alpha': 0.7}, False))
+
+    return {'title': f'Power Data for {args.group} {headerData}', 'period': f'Data from {startDate} to {endDate}',
+            'stats': stats, 'summaries': [earlier['summary'] for earlier in comparisons.values()],
+            'disclaimers': list(disclaimers), 'edges': np.asarray(edges, dtype=np.int64), 'lines': lines,
+            'energy': [energies[start] for start in edges[:-1].tolist()] if energies else None, 'numDays': numDays}
+
+chart_figures = threading.local() # each thread's reusable chart figure, see chart_figure()
+label_paths = {} # label text -> its outline at LABEL_SIZE, see label_path()
+label_glyphs = {} # glyph -> its outline at the text_to_path font scale, shared by every label
+label_lock = threading.Lock()
+
+def chart_figure():
+    """This thread's figure for draw_chart(): the figure, its Agg canvas and axes with the chrome every
+    chart shares (axis labels, tick font) are built once and reused, and only what the previous chart
+    added is taken off. Returns (fig, ax, twin, added), where twin is the energy axis and added
+    collects what the chart draws.
+    """
+    if getattr(chart_figures, 'figure', None) is None:
+        from matplotlib.figure import Figure # only needed for the figure, --export never pays for it
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Power usage (kW)')
+        ax.tick_params(axis='x', labelsize=9)
+        twin = ax.twinx()
+        twin.set_ylabel('Energy (kWh)')
+        chart_figures.figure = (fig, ax, twin, [])
+    fig, ax, twin, added = chart_figures.figure
+    for artist in added:
+        artist.remove()
+    added.clear()
+    for axes in (ax, twin):
+        axes.relim() # forget the previous chart's data limits
+        axes.set_prop_cycle(None) # and restart its colors
+    return chart_figures.figure
+
+def label_path(text):
+    """Outline of text at LABEL_SIZE points with its baseline starting at (0, 0). Laid out like a TextPath,
+    with kerning, but from glyph outlines that are built once, and kept per text since values recur.
+    """
+    from matplotlib.path import Path
+    from matplotlib.textpath import text_to_path
+    from matplotlib.font_manager import FontProperties, findfont, get_font
+
+    with label_lock:
+        if text not in label_paths:
+            font = get_font(findfont(FontProperties()))
+            font.set_size(text_to_path.FONT_SCALE, text_to_path.DPI)
+            glyphs, new, _ = text_to_path.get_glyphs_with_font(font, text, glyph_map=label_glyphs, return_new_glyphs_only=True)
+            label_glyphs.update(new)
+            verts = [label_glyphs[glyph][0] + [x, y] for glyph, x, y, _ in glyphs]
+            codes = [label_glyphs[glyph][1] for glyph, _, _, _ in glyphs]
+            label_paths[text] = Path(np.concatenate(verts) * (LABEL_SIZE / text_to_path.FONT_SCALE), np.concatenate(codes)) if verts else Path(np.empty((0, 2)))
+        return label_paths[text]
+
+def date_numbers(timestamps):
+    """Matplotlib date numbers (days since the epoch) of timestamps on the local wall clock."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if not len(timestamps):
+        return np.empty(0)
+    return (timestamps + utc_offsets(timestamps)) / 86400
+
+def build_chart(chart):
+    """Draws a chart_data() chart on this thread's figure and returns the figure, ready to be saved.
+    Nothing goes through pyplot's global state and every thread reuses a figure of its own, so charts
+    can be drawn in several threads or processes at once. The values next to the points are one
+    collection of outlines and the ticks come from a date locator, so the time it takes barely depends
+    on the number of points.
+    """
+    from matplotlib.collections import PathCollection
+    from matplotlib.transforms import Affine2D
+    import matplotlib.dates as mdates
+
+    fig, ax, twin, added = chart_figure()
+    edges = chart['edges']
+    labels, offsets = [], []
+    for x, y, label, style, values in chart['lines']:
+        x = date_numbers(x)
+        added.extend(ax.plot(x, y, label=label, **style))
+        if values:
+            y = np.asarray(y, dtype=float)
+            shown = ~np.isnan(y)
+            labels += [label_path(str(val)) for val in y[shown]]
+            offsets += list(zip(x[shown], y[shown]))
+    if labels:
+        values = PathCollection(labels, offsets=offsets, offset_transform=ax.transData,
+                                transform=Affine2D().scale(fig.dpi / 72), facecolors='black', linewidths=0)
+        ax.add_collection(values, autolim=False)
+        added.append(values)
+
+    if chart['numDays'] >= 5: # only labels different days if plotting more than 5 days
+        locator = mdates.DayLocator(interval=max(-(-chart['numDays'] // 12), 1))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+    else: # about 13 ticks, on round times
+        locator = mdates.AutoDateLocator(minticks=5, maxticks=13)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d-%H:%M'))
+    ax.xaxis.set_major_locator(locator)
+    ax.set_xlim(*date_numbers(edges[[0, -1]]))
+
+    added.append(ax.annotate(chart['stats'],
+                xy=(0.5, 0.9), xycoords='figure fraction', ha='center'))
+    added.append(ax.annotate(chart['period'],
+                xy=(0.5, 0.92), xycoords='figure fraction', ha='center'))
+    for i, summary in enumerate(chart['summaries']):
+        added.append(ax.annotate(summary,
+                xy=(0.5, 0.88 - 0.012 * i), xycoords='figure fraction', ha='center', fontsize=9))
+    for i, disclaimer in enumerate(chart['disclaimers']): 
+        added.append(ax.annotate(disclaimer,
+                xy=(0.5, 0.85 - 0.012 * len(chart['summaries']) - 0.01 * i), xycoords='figure fraction', ha='center', fontsize=8, color='red'))
+    ax.set_title(chart['title'], y=1.07)
 
+    twin.set_visible(chart['energy'] is not None)
+    if chart['energy'] is not None: # on a second y axis, sharing the time axis
+        kwh = chart['energy']
+        x = date_numbers((edges[:-1] + edges[1:]) // 2) # centered on their bucket, like the points
+        added.append(twin.bar(x, kwh, width=np.diff(edges) / 86400 * 0.8, alpha=0.3, color='tab:green', label='energy (kWh)'))
+        added.extend(twin.plot(x, np.cumsum(kwh), color='tab:green', label='cumulative energy (kWh)'))
+        handles, names = ax.get_legend_handles_labels()
+        twinHandles, twinNames = twin.get_legend_handles_labels()
+        added.append(ax.legend(handles + twinHandles, names + twinNames))
+    else:
+        added.append(ax.legend())
+    return fig
+
+# OUTPUT TARGETS =======================================================
+# --output FORMAT[@DPI] saves the chart to out-HASH-DPI.FORMAT, where HASH is query_key(): the same
+# query of unchanged data lands on the same names, so charts that already exist are not drawn again.
+target_figure = None # the figure save_target() saves, which forked workers inherit built
+
+def query_key():
+    """Hash of the current query: the options that shape its chart, its period and the size and
+    modification time of every file it reads (and of this script, so a new version redraws).
+    """
+    start, end = startDate.timestamp(), endDate.timestamp()
+    files = {file for a, b in [(start, end)] + compare_ranges() for file in hpc_files(a, b)}
+    files.update(file for source in query_sources()[1:] for file in export_files(source))
+    query = {'group': args.group, 'section': headerData, 'period': [start, end], 'points': args.numPoints,
+             'average': args.avg, 'max': args.max, 'percentiles': args.percentiles, 'energy': args.energy,
+             'compare': args.compare, 'clean': args.plotClean, 'full': args.fullRes,
+             'files': [[file, os.stat(file).st_size, os.stat(file).st_mtime] for file in sorted(files) + [os.path.abspath(__file__)]]}
+    return hashlib.sha256(json.dumps(query).encode()).hexdigest()[:16]
+
+def output_targets():
+    """(path, format, dpi) of every --output target of the current query, [] without --output."""
+    if not args.outputs:
+        return []
+    key = query_key()
+    return [(f'out-{key}-{dpi}.{format}', format, dpi) for format, dpi in dict.fromkeys(args.outputs)]
+
+def cached(targets):
+    """Whether every target was already drawn by an earlier run of the same query."""
+    return bool(targets) and all(os.path.exists(path) for path, _, _ in targets)
+
+def save_figure(fig, target):
+    """Saves fig to a (path, format, dpi) target, format None going by the extension (png without one). Written to a
+    temporary file first, so a target that exists is always a whole chart."""
+    path, format, dpi = target
+    fig.savefig(path + '.tmp', format=format or os.path.splitext(path)[1][1:].lower() or 'png', dpi=dpi)
+    os.replace(path + '.tmp', path)
+    return path
+
+def save_target(target):
+    return save_figure(target_figure, target)
+
+def draw_chart(chart, targets=None, workers=1, format='jpg'):
+    """Draws a chart_data() chart, the one way charts are drawn. Builds it once and saves it to every
+    (path, format, dpi) target, from up to workers forked processes that inherit the built figure, or one
+    after another where fork is not available, and returns the paths written. Without targets, returns
+    the image bytes in `format` instead.
+    """
+    global target_figure
+    fig = build_chart(chart)
+    if targets is None:
+        image = io.BytesIO()
+        fig.savefig(image, format=format)
+        return image.getvalue()
+    workers = min(workers, len(targets))
+    if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        target_figure = fig
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            return list(pool.map(save_target, targets))
+    return [save_figure(fig, target) for target in targets]
+
+def draw_charts(charts):
+    """Draws (chart, targets) pairs at the same time: a forked worker process each where fork is
+    available, like load_sources(), otherwise threads, which draw_chart() is safe to share when it
+    saves the targets itself.
+    """
+    if len(charts) <= 1:
+        for chart, targets in charts:
+            for path in draw_chart(chart, targets):
+                print("CHART WRITTEN:", path)
+        return
+    workers = min(len(charts), os.cpu_count() or 1)
+    try:
+        pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    except (ValueError, OSError, NotImplementedError):
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+    with pool:
+        for paths in pool.map(draw_chart, *zip(*charts)):
+            for path in paths:
+                print("CHART WRITTEN:", path)
+
+def render(edges, targets=None):
+    """Draws averages/maxes as filled in by calculate() to every (path, format, dpi) target, out.jpg by default."""
     print("\nSETTING UP FIGURE...")
-    fig, ax = plt.subplots()
-    fig.set_size_inches(19.2, 14.4)
-
-    if averages:
-        dates, avgs = list(averages.keys()), list(averages.values())
-        plt.plot(np.arange(len(dates)), avgs, label='average')
-        if not args.plotClean:
-            for i, val in enumerate(avgs):
-                plt.text(i, val, str(val), fontsize=8)
-        # print(dates, avgs)
-    if maxes: 
-        dates, maxs = list(maxes.keys()), list(maxes.values())
-        plt.plot(np.arange(len(dates)), maxs, label='maximum')
-        if not args.plotClean:
-            for i, val in enumerate(maxs):
-                plt.text(i, val, str(val), fontsize=8)
-        # print(dates, maxs)
-
-    plt.xticks(np.arange(len(dates)), dates, fontsize=9)
-    plt.annotate(stats,
-                xy=(0.5, 0.9), xycoords='figure fraction', ha='center')
-    plt.annotate(period,
-                xy=(0.5, 0.92), xycoords='figure fraction', ha='center')
-    for i, disclaimer in enumerate(disclaimers): 
-        plt.annotate(disclaimer,
-                xy=(0.5, 0.85 - 0.01 * i), xycoords='figure fraction', ha='center', fontsize=8, color='red')
-
-    ax.set_title(f'Power Data for {args.group} {headerData}', y=1.07)
-    ax.set_xlabel('Time')
-    ax.set_ylabel('Power usage (kW)')
-    # ax.set_ylim(min(filedata[args.group]) - totMax * 0.05, totMax + totMax * 0.1)
-
-    ticks = ax.xaxis.get_ticklabels();
-
-    if(numDays < 5 and int(args.numPoints) < 26): #labels 13 ticks
-        for label in ax.xaxis.get_ticklabels()[1::2]:
-            label.set_visible(False)
-
-    elif(numDays < 5):
-        interval = int(args.numPoints)//12 + (int(args.numPoints) % 12 > 0)
-        for i in range(0,len(ticks)):
-            if(i%interval != 0):
-                ticks[i].set_visible(False)
-
-    else: #only labels different days if plotting more than 5 days
-        ticks[0].set_text(ticks[0].get_text()[0:5])
-        if(numDays > 21):
-            interval = (numDays // 12) + (numDays % 12 > 0)
-        else:
-            interval = 1
-        x = 1
-        for i in range(1,len(ticks)):
-            if(ticks[i].get_text()[0:5] == ticks[i-1].get_text()[0:5]):
-                ticks[i].set_visible(False)
+    for path in draw_chart(chart_data(edges), targets or [('out.jpg', 'jpg', CHART_DPI)], args.outputWorkers):
+        print("CHART WRITTEN:", path)
+
+# EXPORT ===============================================================
+def export_rows(edges):
+    """Yields one dict per bucket: its start (epoch and local time), the group's mean/max/min load, each
+    --percentile as pP, the energy as kwh with --energy, the average/max of every --compare OFFSET as
+    mean-OFFSET/max-OFFSET and the sample count."""
+    mean, high, low = group_load('mean', edges), group_load('max', edges), group_load('min', edges)
+    quantiles = {f'p{p:g}': percentile_load(p, edges) for p in args.percentiles or []}
+    if args.energy:
+        quantiles['kwh'] = group_energy(edges)[0]
+    for offset, earlier in comparisons.items():
+        quantiles[f'mean-{offset}'] = list(earlier['mean'].values())
+        quantiles[f'max-{offset}'] = list(earlier['max'].values())
+    for i, start in enumerate(edges[:-1]):
+        row = {'timestamp': int(start), 'time': datetime.fromtimestamp(int(start)).isoformat(),
+               'mean': float(mean[i]), 'max': float(high[i]), 'min': float(low[i])}
+        row.update({name: float(values[i]) for name, values in quantiles.items()})
+        row['count'] = counts[int(start)]
+        yield row
+
+def export(path, edges):
+    """Streams the export_rows() of the query to path, in the format given by its extension.
+    Empty buckets have NaN (CSV, Parquet) or null (JSON lines) loads. The disclaimers go first, as
+    '#' comment lines in CSV, a {"disclaimers": [...]} line in JSON lines and file metadata in Parquet.
+    """
+    quantiles = [f'p{p:g}' for p in args.percentiles or []] + (['kwh'] if args.energy else [])
+    quantiles += [f'{stat}-{offset}' for offset in comparisons for stat in ('mean', 'max')]
+    fields = ['timestamp', 'time', 'mean', 'max', 'min'] + quantiles + ['count']
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("--export to .parquet needs pyarrow, write .csv or .jsonl instead")
+        schema = pa.schema([('timestamp', pa.int64()), ('time', pa.string()), ('mean', pa.float64()), ('max', pa.float64()),
+                            ('min', pa.float64())] + [(name, pa.float64()) for name in quantiles] + [('count', pa.int64())], metadata={'disclaimers': json.dumps(disclaimers)})
+        rows = export_rows(edges)
+        with pq.ParquetWriter(path, schema) as writer:
+            while True:
+                batch = [row for _, row in zip(range(EXPORT_BATCH), rows)]
+                if not batch:
+                    break
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    else:
+        with open(path, 'w', newline='') as f:
+            if extension == '.csv':
+                for disclaimer in disclaimers:
+                    f.write(f"# {disclaimer}\n")
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(export_rows(edges))
             else:
-                if(x % interval != 0):
-                    ticks[i].set_visible(False)
-                else: 
-                    ticks[i].set_text(ticks[i].get_text()[0:5])
-                x = x+1
+                f.write(json.dumps({'disclaimers': disclaimers}) + "\n")
+                for row in export_rows(edges):
+                    f.write(json.dumps({key: None if value != value else value for key, value in row.items()}) + "\n")
+    print("EXPORT WRITTEN:", path)
+
+# HTML OUTPUT ==========================================================
+def zoom_pyramid(times, values, base=PYRAMID_BASE, factor=PYRAMID_FACTOR, top=PYRAMID_TOP):
+    """Min/mean/max tiles of a series at successively coarser resolutions, built in one pass over the samples.
+    Level 0 has `base`-second tiles and every following level merges `factor` tiles of the previous one,
+    until a level has at most `top` tiles. Empty tiles are left out; `i` counts tiles from `t0`.
+    No samples give no levels.
+    """
+    if not len(times):
+        return []
+    edges = bucket_edges(int(times[0]), int(times[-1]) + 1, base)
+    stats = bucket_stats(times, values, edges)
+    count, total, lows, highs = stats['count'], stats['sum'], stats['min'], stats['max']
+    width = base
+    levels = []
+    while True:
+        keep = np.flatnonzero(count)
+        levels.append({
+            'w': width,
+            't0': int(edges[0]),
+            'i': keep.tolist(),
+            'lo': np.round(lows[keep], 2).tolist(),
+            'mean': np.round(total[keep] / count[keep], 2).tolist(),
+            'hi': np.round(highs[keep], 2).tolist(),
+        })
+        if len(count) <= top:
+            return levels
+        pad = -len(count) % factor # merge the next level from this one, not from the samples
+        count = np.append(count, np.zeros(pad, dtype=count.dtype)).reshape(-1, factor).sum(axis=1)
+        total = np.append(total, np.zeros(pad)).reshape(-1, factor).sum(axis=1)
+        lows = np.fmin.reduce(np.append(lows, np.full(pad, np.nan)).reshape(-1, factor), axis=1)
+        highs = np.fmax.reduce(np.append(highs, np.full(pad, np.nan)).reshape(-1, factor), axis=1)
+        width *= factor
+
+def write_html(path):
+    """Writes the group's cleaned series as a self-contained page that zooms and pans in the browser.
+    The page embeds a zoom_pyramid() of the series and draws the coarsest level that still has a tile
+    per pixel, so no data is re-read when zooming into an incident. Without samples it only shows the
+    disclaimers.
+    """
+    times, load = group_series()
+    keep = ~np.isnan(load)
+    data = {
+        'title': f'Power Data for {args.group} {headerData}'.strip(),
+        'period': f'Data from {startDate} to {endDate}',
+        'disclaimers': disclaimers,
+        'levels': zoom_pyramid(times[keep], load[keep]),
+    }
+    with open(path, 'w') as f:
+        f.write(HTML_TEMPLATE.replace('__DATA__', json.dumps(data, separators=(',', ':'))))
+    print("HTML WRITTEN:", path)
+
+# HEATMAP ==============================================================
+def utc_offsets(times):
+    """Local UTC offset (seconds) at each timestamp, looked up in a table of the offset at every hour
+    the timestamps span, since DST only ever changes on the hour.
+    """
+    first = int(times.min()) // 3600
+    hours = np.arange(first, int(times.max()) // 3600 + 1)
+    table = np.array([datetime.fromtimestamp(int(h) * 3600).astimezone().utcoffset().total_seconds() for h in hours], dtype=np.int64)
+    return table[times // 3600 - first]
+
+def heatmap_grid(times, values, stat):
+    """Reduces samples into a (days x HEATMAP_SLOT slots of the day) array of their 'mean' or 'max',
+    by the local day and time of day of each timestamp. Returns (grid, first day); empty cells are NaN.
+    """
+    keep = ~np.isnan(values)
+    times, values = np.asarray(times, dtype=np.int64)[keep], values[keep]
+    slots = 86400 // HEATMAP_SLOT
+    local = times + utc_offsets(times) # seconds since the epoch on the local wall clock
+    day = local // 86400
+    first = int(day.min())
+    cell = (day - first) * slots + local % 86400 // HEATMAP_SLOT
+    n = (int(day.max()) - first + 1) * slots
+    count = np.bincount(cell, minlength=n)
+    grid = np.full(n, np.nan)
+    if stat == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = np.where(count > 0, np.bincount(cell, weights=values, minlength=n) / count, np.nan)
+    else:
+        order = np.argsort(cell, kind='stable')
+        cell, values = cell[order], values[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(cell)) + 1))
+        grid[cell[starts]] = np.maximum.reduceat(values, starts)
+    return grid.reshape(-1, slots), (datetime(1970, 1, 1) + timedelta(days=first)).date()
+
+def write_heatmap(path):
+    """Draws the group's load over the requested period as a heatmap with a row per day and a column
+    per HEATMAP_SLOT of the day, so daily and weekly patterns line up.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    times, load = group_series()
+    inside = (times >= startDate.timestamp()) & (times <= endDate.timestamp()) # --compare reads earlier periods too
+    if not np.any(inside & ~np.isnan(load)):
+        print("NO SAMPLES FOR THE HEATMAP")
+        return
+    stat = 'max' if args.max and not args.avg else 'mean'
+    grid, first = heatmap_grid(times[inside], load[inside], stat)
+    days = [first + timedelta(days=i) for i in range(len(grid))]
+
+    fig = Figure(figsize=(CHART_SIZE[0], max(4.8, min(0.2 * len(days) + 2, 28.8))), dpi=CHART_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    image = ax.imshow(grid, aspect='auto', interpolation='nearest', cmap='viridis')
+    hours = np.arange(0, 24, 2)
+    ax.set_xticks(hours * 3600 / HEATMAP_SLOT - 0.5, [f'{h:02d}:00' for h in hours])
+    step = max(len(days) // 40, 1)
+    ax.set_yticks(np.arange(0, len(days), step), [f"{day:%a %m/%d}" for day in days[::step]], fontsize=8)
+    fig.colorbar(image, ax=ax, label=f"{'Maximum' if stat == 'max' else 'Average'} power usage (kW)")
+    ax.set_title(f"{f'Power Data for {args.group} {headerData}'.strip()} by Time of Day\nData from {startDate} to {endDate}")
+    ax.set_xlabel(f'Time of day ({HEATMAP_SLOT // 60} min per cell)')
+    ax.set_ylabel('Day')
+    fig.savefig(path)
+    print("HEATMAP WRITTEN:", path)
 
-    plt.xticks(np.arange(len(dates)), ticks)
+# WATCH MODE ===========================================================
+# --watch keeps the cleaning and bucket state of the HPC columns between polls and only ingests the
+# bytes appended to the daily files since the last one, so a poll without new rows costs a stat() per file.
+class HPCTail:
+    """Follows the daily HPC files, returning only the complete rows appended since the last poll."""
+    def __init__(self, columns):
+        self.columns = columns
+        self.files = {} # path -> {'offset': bytes consumed, 'header': column indices of Date + columns}
 
-    plt.legend()
-    # plt.show()
-    plt.savefig('out.jpg')
+    def poll(self, start, end):
+        """(timestamps, values) of the new rows of the files for [start, end]; values is (rows x columns)."""
+        times, rows = [], []
+        paths = hpc_files(start, end)
+        self.files = {path: state for path, state in self.files.items() if path in paths}
+        for path in paths:
+            state = self.files.setdefault(path, {'offset': 0, 'header': None})
+            size = os.stat(path).st_size
+            if size < state['offset']: # rewritten, start over
+                state.update(offset=0, header=None)
+            if size == state['offset']:
+                continue
+            with open(path, 'rb') as f:
+                f.seek(state['offset'])
+                data = f.read(size - state['offset'])
+            complete = data.rfind(b'\n') + 1 # a row still being written waits for the next poll
+            state['offset'] += complete
+            lines = data[:complete].decode(errors='replace').splitlines()
+            if state['header'] is None and lines:
+                schema = hpc_schema(path)
+                state['header'] = [schema.get(c) for c in ['Date'] + self.columns]
+                lines = lines[1:]
+            for row in csv.reader(lines):
+                try:
+                    values = [float(row[i]) if i is not None and row[i] else np.nan for i in state['header'][1:]]
+                    times.append(int(row[state['header'][0]]))
+                except (ValueError, IndexError): # partial or malformed row
+                    continue
+                rows.append(values)
+        return np.array(times, dtype=np.int64), np.array(rows, dtype=float).reshape(-1, len(self.columns))
+
+def shift_stats(stats, old, new):
+    """Moves bucket_stats() results from the buckets of edges `old` onto those of `new`. Buckets that
+    were not in `old` start empty."""
+    moved = bucket_stats(np.empty(0), np.empty(0), new)
+    if stats is None:
+        return moved
+    idx = np.minimum(np.searchsorted(old[:-1], new[:-1]), len(old) - 2)
+    hit = old[idx] == new[:-1]
+    for key in moved:
+        moved[key][hit] = stats[key][idx[hit]]
+    return moved
+
+def watch(interval):
+    """Polls the HPC files every `interval` seconds and rewrites out.jpg whenever a bucket changes.
+    Without -s the window slides so it always ends now.
+    """
+    columns = hpc_columns()
+    tail = HPCTail(columns)
+    hampel = HampelFilter()
+    pending = np.empty(0, dtype=np.int64) # timestamps of the rows the filter has not emitted yet
+    span = endDate.timestamp() - startDate.timestamp()
+    width = bucket_width(startDate.timestamp(), endDate.timestamp(), int(args.numPoints))
+    notes = list(disclaimers)
+    edges = totals = shown = None
+    hpc_data.clear()
+    hpc_data.update({key: [] for key in ['Date'] + columns + [args.group]}) # every sample lives in the running totals
+
+    print(f"\nWATCHING {DATA_DIR} EVERY {interval:g} s FOR", columns)
+    while True:
+        if args.startDate == None:
+            end = time.time()
+            start = end - span
+        else:
+            start, end = startDate.timestamp(), endDate.timestamp()
+        window = bucket_edges(start, end, width)
+        if edges is None or not np.array_equal(window, edges):
+            totals = {key: shift_stats(totals and totals[key], edges, window) for key in ['Date'] + columns}
+            edges = window
+
+        times, values = tail.poll(start, end)
+        if len(times):
+            pending = np.concatenate((pending, times))
+            cleaned = hampel.process(values)
+            done, pending = pending[:len(cleaned)], pending[len(cleaned):]
+            totals['Date'] = merge_stats(totals['Date'], bucket_stats(done, np.zeros(len(done)), edges))
+            for i, column in enumerate(columns):
+                totals[column] = merge_stats(totals[column], bucket_stats(done, cleaned[:, i], edges))
+
+        # the last half window is still waiting on later samples, show it as if the stream ended here
+        preview = hampel.preview().reshape(-1, len(columns))
+        current = {'Date': merge_stats(totals['Date'], bucket_stats(pending, np.zeros(len(pending)), edges))}
+        for i, column in enumerate(columns):
+            current[column] = merge_stats(totals[column], bucket_stats(pending, preview[:, i], edges))
+        sidecar_stats['HPC'] = current
+        state = (edges, current['Date']['count'], group_load('mean', edges), group_load('max', edges))
+        if shown is None or not all(np.array_equal(a, b, equal_nan=True) for a, b in zip(state, shown)):
+            shown = state
+            averages.clear()
+            maxes.clear()
+            counts.clear()
+            disclaimers[:] = notes
+            calculate(edges)
+            render(edges)
+            print(f"{datetime.now():%H:%M:%S} out.jpg updated, {len(times)} new rows, {hampel.outliers} outliers replaced so far")
+        time.sleep(interval)
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Power Data</title>
+<style>
+body { font-family: sans-serif; margin: 20px; }
+h2, p { text-align: center; margin: 4px; }
+.disclaimer { color: red; font-size: 12px; }
+canvas { width: 100%; height: 70vh; cursor: grab; }
+</style></head>
+<body>
+<h2 id="title"></h2><p id="period"></p><div id="disclaimers"></div>
+<canvas id="chart"></canvas>
+<p style="font-size: 12px">Scroll to zoom, drag to pan, double-click to reset. Shaded band: min to max, line: average. <span id="level"></span></p>
+<script>
+const DATA = __DATA__;
+const margin = {left: 70, right: 20, top: 10, bottom: 40};
+const canvas = document.getElementById('chart'), ctx = canvas.getContext('2d');
+document.getElementById('title').textContent = DATA.title;
+document.getElementById('period').textContent = DATA.period;
+for (const text of DATA.disclaimers) {
+  const p = document.createElement('p'); p.className = 'disclaimer'; p.textContent = text;
+  document.getElementById('disclaimers').appendChild(p);
+}
+const empty = DATA.levels.length === 0; // no samples in the period, only the disclaimers are shown
+if (empty) {
+  const p = document.createElement('p'); p.className = 'disclaimer'; p.textContent = 'No samples in this period.';
+  document.getElementById('disclaimers').appendChild(p);
+  canvas.style.display = 'none';
+}
+for (const level of DATA.levels) level.t = level.i.map(k => level.t0 + k * level.w);
+const finest = DATA.levels[0], coarsest = DATA.levels[DATA.levels.length - 1];
+const full = empty ? [0, 1] : [finest.t[0], finest.t[finest.t.length - 1] + finest.w];
+let view = full.slice();
+
+function lowerBound(a, x) {
+  let lo = 0, hi = a.length;
+  while (lo < hi) { const mid = (lo + hi) >> 1; if (a[mid] < x) lo = mid + 1; else hi = mid; }
+  return lo;
+}
+
+function draw() {
+  if (empty) return;
+  const ratio = window.devicePixelRatio || 1;
+  canvas.width = canvas.clientWidth * ratio; canvas.height = canvas.clientHeight * ratio;
+  ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+  const w = canvas.clientWidth - margin.left - margin.right, h = canvas.clientHeight - margin.top - margin.bottom;
+  const level = DATA.levels.find(l => (view[1] - view[0]) / l.w <= w) || coarsest;
+  const a = Math.max(lowerBound(level.t, view[0]) - 1, 0), b = Math.min(lowerBound(level.t, view[1]) + 1, level.t.length);
+  let yMin = Infinity, yMax = -Infinity;
+  for (let k = a; k < b; k++) { yMin = Math.min(yMin, level.lo[k]); yMax = Math.max(yMax, level.hi[k]); }
+  if (!isFinite(yMin)) { yMin = 0; yMax = 1; }
+  const pad = (yMax - yMin) * 0.05 || 1; yMin -= pad; yMax += pad;
+  const x = t => margin.left + (t - view[0]) / (view[1] - view[0]) * w;
+  const y = v => margin.top + (yMax - v) / (yMax - yMin) * h;
+
+  ctx.clearRect(0, 0, canvas.clientWidth, canvas.clientHeight);
+  ctx.save(); ctx.beginPath(); ctx.rect(margin.left, margin.top, w, h); ctx.clip();
+  let start = a; // split into runs of adjacent tiles so gaps in the data stay gaps
+  for (let k = a + 1; k <= b; k++) {
+    if (k < b && level.i[k] === level.i[k - 1] + 1) continue;
+    ctx.beginPath();
+    for (let j = start; j < k; j++) ctx.lineTo(x(level.t[j]), y(level.hi[j]));
+    for (let j = k - 1; j >= start; j--) ctx.lineTo(x(level.t[j]), y(level.lo[j]));
+    ctx.fillStyle = 'rgba(31, 119, 180, 0.25)'; ctx.fill();
+    ctx.beginPath();
+    for (let j = start; j < k; j++) ctx.lineTo(x(level.t[j]), y(level.mean[j]));
+    ctx.strokeStyle = 'rgb(31, 119, 180)'; ctx.lineWidth = 1.2; ctx.stroke();
+    start = k;
+  }
+  ctx.restore();
+
+  ctx.strokeStyle = 'black'; ctx.lineWidth = 1; ctx.strokeRect(margin.left, margin.top, w, h);
+  ctx.fillStyle = 'black'; ctx.font = '12px sans-serif';
+  ctx.textAlign = 'right'; ctx.textBaseline = 'middle';
+  for (let k = 0; k <= 5; k++) {
+    const v = yMin + (yMax - yMin) * k / 5;
+    ctx.fillText(v.toFixed(2), margin.left - 6, y(v));
+  }
+  ctx.textAlign = 'center'; ctx.textBaseline = 'top';
+  for (let k = 0; k <= 6; k++) {
+    const t = view[0] + (view[1] - view[0]) * k / 6;
+    const d = new Date(t * 1000);
+    const label = (d.getMonth() + 1) + '/' + d.getDate() + ' ' + String(d.getHours()).padStart(2, '0') + ':' + String(d.getMinutes()).padStart(2, '0');
+    ctx.fillText(label, x(t), margin.top + h + 8);
+  }
+  ctx.save(); ctx.translate(16, margin.top + h / 2); ctx.rotate(-Math.PI / 2);
+  ctx.fillText('Power usage (kW)', 0, 0); ctx.restore();
+  document.getElementById('level').textContent = '(' + level.w / 60 + ' min tiles)';
+}
+
+function clampView(lo, hi) {
+  const span = Math.min(Math.max(hi - lo, finest.w * 10), full[1] - full[0]);
+  lo = Math.min(Math.max(lo, full[0]), full[1] - span);
+  view = [lo, lo + span];
+}
+
+canvas.addEventListener('wheel', e => {
+  e.preventDefault();
+  const w = canvas.clientWidth - margin.left - margin.right;
+  const t = view[0] + (e.offsetX - margin.left) / w * (view[1] - view[0]);
+  const scale = e.deltaY > 0 ? 1.25 : 0.8;
+  clampView(t - (t - view[0]) * scale, t + (view[1] - t) * scale);
+  draw();
+}, {passive: false});
+let dragging = null;
+canvas.addEventListener('mousedown', e => { dragging = {x: e.offsetX, view: view.slice()}; canvas.style.cursor = 'grabbing'; });
+window.addEventListener('mouseup', () => { dragging = null; canvas.style.cursor = 'grab'; });
+canvas.addEventListener('mousemove', e => {
+  if (!dragging) return;
+  const w = canvas.clientWidth - margin.left - margin.right;
+  const shift = (dragging.x - e.offsetX) / w * (dragging.view[1] - dragging.view[0]);
+  clampView(dragging.view[0] + shift, dragging.view[1] + shift);
+  draw();
+});
+canvas.addEventListener('dblclick', () => { view = full.slice(); draw(); });
+window.addEventListener('resize', draw);
+draw();
+</script>
+</body></html>
+"""
+
+# BATCH JOBS ===========================================================
+# A jobs file lists queries like the command line options, e.g. in JSON:
+#     [{"group": "PDU-A4-1", "start": "03/01/2024", "days": 7, "points": 50, "output": "a4.jpg"},
+#      {"group": "Com Center Main Room", "section": "nonmetered", "days": 30, "points": 30, "export": "room.csv"}]
+# The planner reads the union of their periods and columns once and hands every job its slice.
+JOB_OPTIONS = {'group': 'group', 'start': 'startDate', 'end': 'endDate', 'days': 'numDays', 'points': 'numPoints',
+               'average': 'avg', 'max': 'max', 'clean': 'plotClean', 'percentile': 'percentiles', 'energy': 'energy',
+               'full': 'fullRes', 'html': 'htmlOut', 'heatmap': 'heatmapOut', 'export': 'exportOut'} # job key -> args attribute
+SECTIONS = {'total': '', 'ups': 'UPS', 'ent': 'ENT', 'hpc': 'HPC', 'nonmetered': 'Nonmetered'} # Main Room sections -> headerData
+
+def query_sources():
+    """Sources args.group is computed from."""
+    sources = ['HPC']
+    if args.group == 'Com Center Main Room' and not hpcOnly and not upsOnly: # INCLUDE ENTERPRISE EQUIPMENT DATA
+        sources.append('ENT')
+    if args.group == 'Com Center Main Room' and not hpcOnly and not entOnly: 
+        sources.append('UPS')
+    return sources
+
+def read_jobs(path):
+    """The list of job dicts in a JSON or YAML jobs file, either top-level or under 'jobs'."""
+    with open(path, 'r') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                sys.exit("YAML jobs files need PyYAML, write the jobs file as JSON instead")
+            jobs = yaml.safe_load(f)
+        else:
+            jobs = json.load(f)
+    jobs = jobs['jobs'] if isinstance(jobs, dict) else jobs
+    for i, job in enumerate(jobs):
+        unknown = set(job) - set(JOB_OPTIONS) - {'section', 'output'}
+        if unknown or job.get('group') not in GROUPNAMES or not job.get('points') or not (job.get('days') or job.get('start') and job.get('end')):
+            sys.exit(f"job {i + 1}: needs a valid group, points and days or start and end; unknown options {sorted(unknown)}")
+    return jobs
+
+def configure_job(job):
+    """Sets args, the Main Room flags and the period as if the job had been given on the command line,
+    and empties everything a previous job computed.
+    """
+    global startDate, endDate, numDays, upsOnly, entOnly, hpcOnly, nonmetered, headerData
+    for key, attribute in JOB_OPTIONS.items():
+        value = job.get(key)
+        if key in ('start', 'end') and value != None:
+            value = valid_date(value)
+        if key == 'percentile' and value != None and not isinstance(value, list):
+            value = [value]
+        setattr(args, attribute, value if value != None else False if attribute in ('avg', 'max', 'plotClean', 'energy', 'fullRes') else None)
+    headerData = SECTIONS[job.get('section', 'total')] if args.group == 'Com Center Main Room' else ''
+    upsOnly, entOnly, hpcOnly, nonmetered = (headerData == name for name in ('UPS', 'ENT', 'HPC', 'Nonmetered'))
+    if args.group == 'Com Center Main Room' and headerData == '':
+        headerData = 'Total'
+    startDate, endDate = query_period(args.startDate, args.endDate, args.numDays)
+    numDays = (endDate.date() - startDate.date()).days
+    for state in (hpc_data, ent_data, ups_data, averages, maxes, percentiles, energies, comparisons, counts, sidecar_stats):
+        state.clear()
+    disclaimers.clear()
+
+def merge_ranges(ranges):
+    """Sorted union of (start, end) ranges, overlapping or touching ranges merged."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def plan_jobs(jobs):
+    """What the jobs need between them: {'ranges': merged periods, 'HPC': columns, 'files': HPC files,
+    'exports': ENT/UPS exports, 'reads': file reads the jobs would do one by one}.
+    """
+    periods, columns, files, exports, reads = [], [], set(), {}, 0
+    for job in jobs:
+        configure_job(job)
+        start, end = startDate.timestamp(), endDate.timestamp()
+        periods.append((start, end))
+        columns += [column for column in hpc_columns() if column not in columns]
+        jobFiles = hpc_files(start, end)
+        files.update(jobFiles)
+        reads += len(jobFiles)
+        for source in query_sources()[1:]:
+            exports[source] = export_files(source)
+            reads += len(exports[source])
+    return {'ranges': merge_ranges(periods), 'HPC': columns, 'files': sorted(files), 'exports': exports, 'reads': reads}
+
+def explain(plan, jobs):
+    files = plan['files'] + [file for exports in plan['exports'].values() for file in exports]
+    size = sum(os.stat(file).st_size for file in files)
+    print(f"\nPLAN FOR {len(jobs)} JOBS")
+    print("  periods read:", [(str(datetime.fromtimestamp(a)), str(datetime.fromtimestamp(b))) for a, b in plan['ranges']])
+    print(f"  HPC: {len(plan['files'])} daily files, columns {plan['HPC']}")
+    for source, exports in plan['exports'].items():
+        print(f"  {source}: {len(exports)} exports (only the rows in the periods are read)")
+    print(f"  {len(files)} files, {size / 1e6:.1f} MB at most, read once")
+    print(f"  {plan['reads'] - len(files)} of {plan['reads']} file reads shared between jobs (cache hits)")
+
+def load_shared(plan):
+    """Reads and cleans the planned periods and columns once: {source: (timestamps, {column: values})}."""
+    shared = {}
+    times, values = [np.empty(0, dtype=np.int64)], [np.empty((0, len(plan['HPC'])))]
+    for file in plan['files']:
+        timestamps, table = read_hpc_columns(file, plan['HPC'])
+        table = clean_day(day_context(file), plan['HPC'], table)
+        keep = np.zeros(len(timestamps), dtype=bool)
+        for start, end in plan['ranges']:
+            keep |= (timestamps >= start) & (timestamps <= end)
+        times.append(timestamps[keep])
+        values.append(table[keep])
+    save_hpc_schemas()
+    table = np.concatenate(values)
+    shared['HPC'] = (np.concatenate(times), {column: table[:, i] for i, column in enumerate(plan['HPC'])})
+    for source, exports in plan['exports'].items():
+        timestamps, power = read_trendlog(source, exports, plan['ranges'])
+        shared[source] = (timestamps, {export_readers[source][2]: power})
+    return shared
+
+def slice_job(shared):
+    """Fills hpc_data, ent_data and ups_data with the current job's period of the shared data."""
+    start, end = startDate.timestamp(), endDate.timestamp()
+    for source in query_sources():
+        timestamps, columns = shared[source]
+        if source != 'HPC' and not check_coverage(export_files(source), ent_line_timestamp if source == 'ENT' else ups_line_timestamp,
+                                                  "Enterprise aisle equipment data" if source == 'ENT' else "UPS trendlog"):
+            timestamps, columns = timestamps[:0], {key: values[:0] for key, values in columns.items()}
+        first, last = np.searchsorted(timestamps, start), np.searchsorted(timestamps, end, side='right')
+        data = {'HPC': hpc_data, 'ENT': ent_data, 'UPS': ups_data}[source]
+        data['Date'] = timestamps[first:last].tolist()
+        for key, values in columns.items():
+            if source == 'HPC' and key not in hpc_columns():
+                continue
+            data[key] = values[first:last].tolist()
+    if args.group == 'Com Center Main Room':
+        hpc_data[args.group] = (np.array(hpc_data['SeaWulf Main Room on UPS']) + np.array(hpc_data['SeaWulf Main Room on Non-UPS'])).tolist()
+
+def run_jobs(path):
+    """--jobs-file: plans the jobs, reads what they share once, then aggregates and renders every job.
+    Jobs whose --output targets all exist already are left out before planning, so nothing is read for them.
+    """
+    jobs = read_jobs(path)
+    pending = {} # job number -> its chart targets, for the jobs that still have something to write
+    for i, job in enumerate(jobs):
+        configure_job(job)
+        targets = output_targets()
+        if cached(targets) and not (args.exportOut or args.htmlOut or args.heatmapOut):
+            print(f"JOB {i + 1}/{len(jobs)} CACHED:", [path for path, _, _ in targets])
+            continue
+        pending[i] = targets or [(job.get('output', f'out-{i + 1}.jpg'), None, CHART_DPI)]
+    if not pending:
+        return
+    plan = plan_jobs([jobs[i] for i in pending])
+    explain(plan, [jobs[i] for i in pending])
+    if args.explain:
+        return
+    shared = load_shared(plan)
+    charts = [] # drawn together once every job is computed
+    for i, targets in pending.items():
+        configure_job(jobs[i])
+        print(f"\nJOB {i + 1}/{len(jobs)}: {args.group} {headerData} from {startDate} to {endDate}")
+        width = bucket_width(startDate.timestamp(), endDate.timestamp(), int(args.numPoints))
+        edges = bucket_edges(startDate.timestamp(), endDate.timestamp(), width)
+        slice_job(shared)
+        align()
+        calculate(edges)
+        if args.exportOut:
+            export(args.exportOut, edges)
+        else:
+            charts.append((chart_data(edges), targets))
+        if args.htmlOut:
+            write_html(args.htmlOut)
+        if args.heatmapOut:
+            write_heatmap(args.heatmapOut)
+    save_coverage_cache()
+    draw_charts(charts)
 
 def main():
     locale.setlocale(locale.LC_ALL, 'en_US')
+    if args.jobsFile != None:
+        run_jobs(args.jobsFile)
+        return
 
-    parse_HPC()
-    print("HPC DATA PARSED:", list(hpc_data.keys()))
-    if (len(hpc_data[args.group]) < int(args.numPoints)):
-        print("Cannot have more points than there are data")
-        exit()
-    interval = int(len(hpc_data[args.group]) / int(args.numPoints)) # determines data point per entry
-    print("HPC LENGTH:", len(hpc_data[args.group]))
+    width = bucket_width(startDate.timestamp(), endDate.timestamp(), int(args.numPoints)) # wall-clock time per entry
+    edges = bucket_edges(startDate.timestamp(), endDate.timestamp(), width)
+    sources = query_sources()
 
-    if args.group == 'Com Center Main Room' and not hpcOnly and not upsOnly: # INCLUDE ENTERPRISE EQUIPMENT DATA
-        parse_ENT()
+    if args.watch != None:
+        watch(args.watch)
+        return
+    targets = output_targets()
+    if cached(targets) and not (args.htmlOut or args.heatmapOut):
+        print("CHART CACHED:", [path for path, _, _ in targets])
+        return
+
+    days, ranges = plan_query(width)
+    if days:
+        print(f"\nUSING SIDECARS FOR {len(days)} WHOLE DAYS, RAW ROWS FOR", [(datetime.fromtimestamp(a), datetime.fromtimestamp(b)) for a, b in ranges])
+        load_sidecar_stats(days, edges, sources)
+
+    if use_index():
+        load_index_stats(edges, ranges)
+        ranges = [] # nothing left to read
+    if args.compare:
+        ranges = merge_ranges(ranges + compare_ranges()) # every period in one read
+    if args.maxMemory != None and ranges and run_chunked(sources, ranges, edges):
+        sources = [] # nothing left to load or print
+    else:
+        load_sources(sources, ranges)
+        print("HPC DATA PARSED:", list(hpc_data.keys()))
+        if not days and ranges and (len(hpc_data[args.group]) < int(args.numPoints)):
+            print("Cannot have more points than there are data")
+            exit()
+        print("HPC LENGTH:", len(hpc_data[args.group]))
+
+    if 'ENT' in sources:
         for key in ent_data:
             print(key, ent_data[key][:10])
         print("ENT LENGTH:", len(ent_data[args.group]))
 
-    if args.group == 'Com Center Main Room' and not hpcOnly and not entOnly: 
-        parse_UPS()
+    if 'UPS' in sources:
         for key in ups_data:
             print(key, ups_data[key][:10])
         print("UPS LENGTH:", len(ups_data['UPS_AVG']))
 
-    clean_data(hpc_data)
-    if ups_data: clean_data(ups_data)
-    if ent_data: clean_data(ent_data)
-
     align()
-    calculate(interval)
+    calculate(edges)
+    if args.exportOut:
+        export(args.exportOut, edges)
+    else:
+        render(edges, targets)
+    if args.htmlOut:
+        write_html(args.htmlOut)
+    if args.heatmapOut:
+        write_heatmap(args.heatmapOut)
     return
 
 main()
\ No newline at end of file